@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import argparse
+from collections import OrderedDict
+
+
+# arnoldExportAss flags, file extension and typical size ratio (uncompressed / on disk) per compression mode
+ASS_COMPRESSION = OrderedDict(
+    [
+        ("None", {"flags": [], "ext": ".ass", "ratio": 1.0}),
+        ("Gzip", {"flags": ["-compressed"], "ext": ".ass.gz", "ratio": 5.0}),
+    ]
+)
+
+
+# render settings overrides applied before every .ass export
+ASS_EXPORT_SETTINGS = [
+    ("defaultRenderGlobals.animation", 1),  # always use 'name.#.ext' format
+    ("defaultRenderGlobals.outFormatControl", 0),
+    ("defaultRenderGlobals.putFrameBeforeExt", 1),
+    ("defaultRenderGlobals.periodInExt", 1),
+    ("defaultArnoldRenderOptions.binaryAss", 1),
+    ("defaultArnoldRenderOptions.expandProcedurals", 1),
+    ("defaultArnoldRenderOptions.outputAssBoundingBox", 1),
+    ("defaultArnoldRenderOptions.absoluteTexturePaths", 1),
+    ("defaultArnoldRenderOptions.absoluteProceduralPaths", 1),
+    ("defaultArnoldRenderOptions.plugins_path", ""),
+    ("defaultArnoldRenderOptions.procedural_searchpath", ""),
+    ("defaultArnoldRenderOptions.texture_searchpath", ""),
+    # clear the filename to force using the default filename from RenderGlobals
+    ("defaultArnoldRenderOptions.output_ass_filename", ""),
+]
+
+
+def applyAssExportSettings(cmds):
+    for attr, value in ASS_EXPORT_SETTINGS:
+        if isinstance(value, str):
+            cmds.setAttr(attr, value, type="string")
+        else:
+            cmds.setAttr(attr, value)
+
+
+def getAssCompressionModes():
+    return list(ASS_COMPRESSION.keys())
+
+
+def getAssExportFlags(compression):
+    return ASS_COMPRESSION.get(compression, ASS_COMPRESSION["None"])["flags"]
+
+
+def getAssExtension(compression):
+    return ASS_COMPRESSION.get(compression, ASS_COMPRESSION["None"])["ext"]
+
+
+def getAssExportCommand(filename, startFrame, endFrame, compression, selected=False):
+    cmd = "arnoldExportAss"
+    cmd += " -startFrame %d" % int(startFrame)
+    cmd += " -endFrame %d" % int(endFrame)
+    cmd += " -frameStep %d" % 1
+    for flag in getAssExportFlags(compression):
+        cmd += " " + flag
+
+    if selected:
+        cmd += " -selected"
+
+    cmd += ' -filename "%s"' % (filename + getAssExtension(compression)).replace("\\", "/")
+    return cmd
+
+
+def getExportedAssFiles(filename, compression):
+    # arnoldExportAss writes one file per frame: <filename>.<frame>.<ext>
+    folder, base = os.path.split(filename)
+    ext = getAssExtension(compression)
+    files = []
+    if not os.path.isdir(folder):
+        return files
+
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.startswith(base + ".") and entry.name.endswith(ext):
+            files.append(entry.path)
+
+    return sorted(files)
+
+
+def getExpectedAssFiles(filename, compression, frames):
+    ext = getAssExtension(compression)
+    return ["%s.%04d%s" % (filename, frame, ext) for frame in frames]
+
+
+def estimateRenderMemory(files, compression, factor=3.0, baseMemory=1024):
+    # kick needs a multiple of the scene description plus a fixed base, the largest frame decides
+    sizes = [os.path.getsize(path) for path in files if os.path.isfile(path)]
+    if not sizes:
+        return
+
+    ratio = ASS_COMPRESSION.get(compression, ASS_COMPRESSION["None"])["ratio"]
+    return int(max(sizes) / (1024.0 * 1024.0) * ratio * factor + baseMemory)
+
+
+def exportScene(cmds, mel, sceneFile, filename, startFrame, endFrame, compression, layer=None):
+    cmds.file(sceneFile, open=True, force=True)
+    cmds.loadPlugin("mtoa", quiet=True)
+    applyAssExportSettings(cmds)
+    if layer and layer != cmds.editRenderLayerGlobals(q=True, currentRenderLayer=True):
+        cmds.editRenderLayerGlobals(currentRenderLayer=layer)
+
+    mel.eval(getAssExportCommand(filename, startFrame, endFrame, compression))
+
+
+def getKickParseTime(assFile, kick="kick"):
+    # a tiny render is dominated by reading and initializing the scene
+    outFile = os.path.join(tempfile.mkdtemp(prefix="afKick_"), "probe.exr")
+    cmd = [kick, "-i", assFile, "-dw", "-dp", "-r", "8", "8", "-o", outFile, "-v", "0"]
+    start = time.time()
+    try:
+        subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    finally:
+        shutil.rmtree(os.path.dirname(outFile), ignore_errors=True)
+
+    return time.time() - start
+
+
+def benchmarkCurrentScene(mel, outputDir, startFrame, endFrame, compressions=None, kick="kick"):
+    results = []
+    for compression in compressions or getAssCompressionModes():
+        folder = os.path.join(outputDir, compression.lower())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+        os.makedirs(folder)
+        filename = os.path.join(folder, "bench")
+        start = time.time()
+        mel.eval(getAssExportCommand(filename, startFrame, endFrame, compression))
+        exportTime = time.time() - start
+
+        files = getExportedAssFiles(filename, compression)
+        parseTimes = [getKickParseTime(f, kick=kick) for f in files[:3]]
+        parseTimes = [t for t in parseTimes if t is not None]
+        results.append(
+            {
+                "compression": compression,
+                "files": len(files),
+                "bytes": sum(os.path.getsize(f) for f in files),
+                "exportTime": exportTime,
+                "kickTime": sum(parseTimes) / len(parseTimes) if parseTimes else None,
+            }
+        )
+
+    return results
+
+
+def formatReport(scene, results):
+    lines = ["%s:" % scene]
+    lines.append(
+        "    %-10s %8s %14s %12s %14s" % ("mode", "files", "bytes", "export (s)", "kick/frame (s)")
+    )
+    for result in results:
+        kickTime = "%.2f" % result["kickTime"] if result["kickTime"] is not None else "n/a"
+        lines.append(
+            "    %-10s %8d %14d %12.2f %14s"
+            % (result["compression"], result["files"], result["bytes"], result["exportTime"], kickTime)
+        )
+
+    return "\n".join(lines)
+
+
+def runBenchmark(args):
+    import maya.standalone
+    maya.standalone.initialize()
+    import maya.cmds as cmds
+    import maya.mel as mel
+
+    cmds.loadPlugin("mtoa", quiet=True)
+    outputDir = args.output or tempfile.mkdtemp(prefix="afAssBench_")
+    try:
+        for scene in args.scenes:
+            cmds.file(scene, open=True, force=True)
+            applyAssExportSettings(cmds)
+            results = benchmarkCurrentScene(
+                mel, outputDir, args.start, args.end, compressions=args.modes, kick=args.kick
+            )
+            print(formatReport(scene, results))
+    finally:
+        if not args.output:
+            shutil.rmtree(outputDir, ignore_errors=True)
+
+        maya.standalone.uninitialize()
+
+    return 0
+
+
+def runExport(args):
+    import maya.standalone
+    maya.standalone.initialize()
+    import maya.cmds as cmds
+    import maya.mel as mel
+
+    try:
+        exportScene(
+            cmds, mel, args.scene, args.filename, args.start, args.end, args.compression, layer=args.layer
+        )
+    finally:
+        maya.standalone.uninitialize()
+
+    return 0
+
+
+def getFrameCommand(command, frame):
+    # "####" runs in the arguments are replaced with the padded frame, Afanasy only touches "@####@"
+    return [re.sub(r"#+", lambda m: str(frame).zfill(len(m.group(0))), arg) for arg in command]
+
+
+def runFrames(args):
+    # renders the frames of a chunked task one after another
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    for frame in range(args.start, args.end + 1):
+        code = subprocess.call(getFrameCommand(command, frame))
+        if code:
+            print("frame %s failed with exit code %s" % (frame, code))
+            return code
+
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Export and benchmark Arnold .ass files. Run with mayapy.")
+    subparsers = parser.add_subparsers(dest="mode")
+
+    benchParser = subparsers.add_parser(
+        "benchmark", help="compare compression modes: bytes written, export time and kick parse time"
+    )
+    benchParser.add_argument("scenes", nargs="+", help="Maya scenes to benchmark")
+    benchParser.add_argument("--start", type=int, default=1)
+    benchParser.add_argument("--end", type=int, default=3)
+    benchParser.add_argument("--modes", nargs="*", default=getAssCompressionModes())
+    benchParser.add_argument("--kick", default="kick")
+    benchParser.add_argument("--output", default=None, help="temporary export folder")
+
+    exportParser = subparsers.add_parser("export", help="export a frame range of a scene to .ass files")
+    exportParser.add_argument("--scene", required=True)
+    exportParser.add_argument("--filename", required=True, help="output path without frame number and extension")
+    exportParser.add_argument("--start", type=int, required=True)
+    exportParser.add_argument("--end", type=int, required=True)
+    exportParser.add_argument("--compression", default="None", choices=getAssCompressionModes())
+    exportParser.add_argument("--layer", default=None)
+
+    framesParser = subparsers.add_parser("frames", help="run a command for every frame of a chunked task")
+    framesParser.add_argument("--start", type=int, required=True)
+    framesParser.add_argument("--end", type=int, required=True)
+    framesParser.add_argument("command", nargs=argparse.REMAINDER, help="-- command with #### frame placeholders")
+
+    args = parser.parse_args(args)
+    if args.mode == "benchmark":
+        return runBenchmark(args)
+    elif args.mode == "export":
+        return runExport(args)
+    elif args.mode == "frames":
+        return runFrames(args)
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
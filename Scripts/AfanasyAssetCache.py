@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Runs on the render nodes before a task:
+# syncs the dependencies listed in the job manifest into a node-local cache,
+# remaps them for Arnold through ARNOLD_PATHMAP and executes the task command.
+#
+# python AfanasyAssetCache.py --manifest job_manifest.json --cache-dir D:/afcache --max-size 200 -- kick -i scene.0001.ass
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import re
+import argparse
+import platform
+import tempfile
+import subprocess
+
+
+LOCK_TIMEOUT = 600
+# leases of tasks that crashed without releasing them
+LEASE_TIMEOUT = 86400
+
+
+def log(text):
+    sys.stdout.write("Prism asset cache - %s\n" % text)
+    sys.stdout.flush()
+
+
+def getDefaultCacheDir():
+    return os.getenv("AF_ASSET_CACHE") or os.path.join(tempfile.gettempdir(), "prism_afanasy_cache")
+
+
+def getCacheKey(path):
+    # the source layout is mirrored in the cache: "//server/share/tex/a.tx" -> "server/share/tex/a.tx"
+    return re.sub(r"^/+", "", path.replace("\\", "/")).replace(":", "")
+
+
+def getFolder(path):
+    return os.path.dirname(path.replace("\\", "/"))
+
+
+class CacheLock(object):
+    # several tasks can run on one host at the same time
+    def __init__(self, cacheDir):
+        self.path = os.path.join(cacheDir, "index.lock")
+
+    def __enter__(self):
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except OSError:
+                if time.time() - start > LOCK_TIMEOUT:
+                    log("removing stale lock %s" % self.path)
+                    os.remove(self.path)
+                    start = time.time()
+
+                time.sleep(0.2)
+
+    def __exit__(self, *args):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class AssetCache(object):
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.fileDir = os.path.join(cacheDir, "files")
+        self.indexPath = os.path.join(cacheDir, "index.json")
+        self.maxBytes = maxBytes
+        self.taskId = uuid.uuid4().hex
+        if not os.path.exists(self.fileDir):
+            os.makedirs(self.fileDir)
+
+    def readIndex(self):
+        if not os.path.exists(self.indexPath):
+            return {}
+
+        try:
+            with open(self.indexPath, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def writeIndex(self, index):
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(index, f)
+
+        os.replace(tmpPath, self.indexPath)
+
+    def getCachedPath(self, path):
+        key = getCacheKey(path)
+        return key, os.path.join(self.fileDir, *key.split("/"))
+
+    def isCurrent(self, cachedPath, dep):
+        try:
+            stat = os.stat(cachedPath)
+        except OSError:
+            return False
+
+        # copies keep the modification time of the source
+        return stat.st_size == dep["size"] and abs(stat.st_mtime - dep["mtime"]) < 1
+
+    def fetch(self, dep):
+        key, cachedPath = self.getCachedPath(dep["path"])
+        if self.isCurrent(cachedPath, dep):
+            return key, cachedPath, 0
+
+        folder = os.path.dirname(cachedPath)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        tmpPath = "%s.%s.tmp" % (cachedPath, uuid.uuid4().hex)
+        try:
+            shutil.copy2(dep["path"], tmpPath)
+            os.replace(tmpPath, cachedPath)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+        return key, cachedPath, dep["size"]
+
+    def isLeased(self, entry, now):
+        return any(now - leaseTime < LEASE_TIMEOUT for leaseTime in entry.get("leases", {}).values())
+
+    def acquire(self, keys):
+        # files leased by a running task are never evicted, also not by other tasks on the host
+        with CacheLock(self.cacheDir):
+            index = self.readIndex()
+            now = time.time()
+            for key in keys:
+                entry = index.setdefault(key, {"size": 0, "atime": now})
+                entry.setdefault("leases", {})[self.taskId] = now
+
+            self.writeIndex(index)
+
+    def release(self):
+        with CacheLock(self.cacheDir):
+            index = self.readIndex()
+            for key, entry in list(index.items()):
+                entry.get("leases", {}).pop(self.taskId, None)
+                # placeholders of files that failed to cache
+                if not entry["size"] and not entry.get("leases"):
+                    del index[key]
+
+            self.writeIndex(index)
+
+    def evict(self, index):
+        total = sum(entry["size"] for entry in index.values())
+        if total <= self.maxBytes:
+            return 0
+
+        freed = 0
+        now = time.time()
+        for key, entry in sorted(index.items(), key=lambda x: x[1]["atime"]):
+            if total <= self.maxBytes:
+                break
+
+            if self.isLeased(entry, now):
+                continue
+
+            path = os.path.join(self.fileDir, *key.split("/"))
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    # still read by another task, evicted next time
+                    continue
+
+            total -= entry["size"]
+            freed += entry["size"]
+            del index[key]
+
+        return freed
+
+    def isFolderComplete(self, folder, cachedPaths):
+        # folders are mapped as a whole, so every file below them has to be in the cache
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                if os.path.join(root, name).replace("\\", "/") not in cachedPaths:
+                    return False
+
+        return True
+
+    def sync(self, dependencies):
+        # returns {source folder: cache folder} for the folders with all their files cached
+        self.acquire([self.getCachedPath(dep["path"])[0] for dep in dependencies])
+        folderMap = {}
+        failedFolders = set()
+        cachedPaths = set()
+        copied = 0
+        used = {}
+        for dep in dependencies:
+            folder = getFolder(dep["path"])
+            if not os.path.isfile(dep["path"]) or dep["size"] > self.maxBytes:
+                failedFolders.add(folder)
+                continue
+
+            try:
+                key, cachedPath, size = self.fetch(dep)
+            except (IOError, OSError) as e:
+                log("failed to cache %s: %s" % (dep["path"], e))
+                failedFolders.add(folder)
+                continue
+
+            copied += size
+            used[key] = dep["size"]
+            cachedPaths.add(dep["path"].replace("\\", "/"))
+            folderMap[folder] = os.path.dirname(cachedPath)
+
+        for folder in list(folderMap):
+            # files the manifest doesn't know, like textures of stand-ins, would resolve to missing cache paths
+            if folder in failedFolders or not self.isFolderComplete(folder, cachedPaths):
+                folderMap.pop(folder)
+
+        with CacheLock(self.cacheDir):
+            index = self.readIndex()
+            now = time.time()
+            for key, size in used.items():
+                index.setdefault(key, {}).update({"size": size, "atime": now})
+
+            freed = self.evict(index)
+            self.writeIndex(index)
+
+        log(
+            "%s of %s dependencies cached in %s folders, %.1f MB copied, %.1f MB evicted"
+            % (len(used), len(dependencies), len(folderMap), copied / 1048576.0, freed / 1048576.0)
+        )
+        return folderMap
+
+
+def writePathMap(folderMap, cacheDir):
+    # folder prefixes, so token paths like <udim> resolve in the cache too, only complete folders are in the map
+    system = {"Windows": "windows", "Darwin": "mac"}.get(platform.system(), "linux")
+    mapping = {}
+    for src, dst in folderMap.items():
+        dst = dst.replace("\\", "/") + "/"
+        mapping[src.replace("\\", "/") + "/"] = dst
+        mapping[src.replace("/", "\\") + "\\"] = dst
+
+    path = os.path.join(cacheDir, "pathmap_%s.json" % uuid.uuid4().hex)
+    with open(path, "w") as f:
+        json.dump({system: mapping}, f, indent=4)
+
+    return path
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Sync job dependencies into a node-local cache and run a command.")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--max-size", type=float, default=200, help="cache size in GB")
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(args)
+
+    command = args.command
+    if command and command[0] == "--":
+        command = command[1:]
+
+    cacheDir = args.cache_dir or getDefaultCacheDir()
+    env = os.environ.copy()
+    pathMapFile = None
+    cache = None
+    try:
+        with open(args.manifest, "r") as f:
+            manifest = json.load(f)
+
+        cache = AssetCache(cacheDir, int(args.max_size * 1024 ** 3))
+        folderMap = cache.sync(manifest.get("dependencies", []))
+        if folderMap:
+            pathMapFile = writePathMap(folderMap, cacheDir)
+            env["ARNOLD_PATHMAP"] = pathMapFile
+    except Exception as e:
+        # never fail the task because of the cache, render from the file server instead
+        log("cache disabled for this task: %s" % e)
+
+    try:
+        return subprocess.call(command, env=env)
+    finally:
+        if pathMapFile and os.path.exists(pathMapFile):
+            os.remove(pathMapFile)
+
+        if cache:
+            try:
+                cache.release()
+            except Exception as e:
+                log("failed to release the cached files: %s" % e)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Runs on the farm after the render tasks of a job:
+# deletes the files listed in the job manifest and reports the reclaimed bytes.
+#
+# python AfanasyCleanup.py --manifest job_manifest.json --generated --scene
+
+import os
+import sys
+import json
+import time
+import argparse
+
+
+def log(text):
+    sys.stdout.write("Prism cleanup - %s\n" % text)
+    sys.stdout.flush()
+
+
+def removeFile(path):
+    try:
+        stat = os.stat(path)
+        os.remove(path)
+    except OSError:
+        return 0
+
+    # a hardlinked file only frees space when its last link is removed
+    return stat.st_size if stat.st_nlink <= 1 else 0
+
+
+def removeEmptyFolders(folders):
+    for folder in sorted(folders, key=len, reverse=True):
+        try:
+            os.rmdir(folder)
+        except OSError:
+            pass
+
+
+def collectStoreGarbage(storeRoot, grace=3600):
+    # objects without refs, the grace period protects objects of submissions that are still running
+    reclaimed = 0
+    objectDir = os.path.join(storeRoot, "objects")
+    refDir = os.path.join(storeRoot, "refs")
+    if not os.path.isdir(objectDir):
+        return reclaimed
+
+    now = time.time()
+    for bucket in os.scandir(objectDir):
+        if not bucket.is_dir():
+            continue
+
+        for entry in os.scandir(bucket.path):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+
+            refs = os.path.join(refDir, entry.name)
+            if os.path.isdir(refs):
+                if os.listdir(refs) or now - os.stat(refs).st_mtime < grace:
+                    continue
+            elif now - entry.stat().st_mtime < grace:
+                continue
+
+            reclaimed += removeFile(entry.path)
+
+    return reclaimed
+
+
+def cleanup(manifest, generated=True, scene=False, prefix=None, storeRoot=None):
+    files = []
+    if generated:
+        files += [f for f in manifest.get("generated", []) if not prefix or f.startswith(prefix)]
+
+    if scene and manifest.get("sceneRef") and os.path.exists(manifest["sceneRef"]):
+        # the scene is shared with other jobs in the store, only the ref of this job goes.
+        # The empty ref folder stays, its mtime starts the grace period of the object
+        os.remove(manifest["sceneRef"])
+
+    reclaimed = 0
+    removed = 0
+    folders = set()
+    for path in files:
+        if not os.path.exists(path):
+            continue
+
+        reclaimed += removeFile(path)
+        removed += 1
+        folders.add(os.path.dirname(path))
+
+    removeEmptyFolders(folders)
+    if scene and storeRoot:
+        reclaimed += collectStoreGarbage(storeRoot)
+
+    return removed, reclaimed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Delete the generated files of a job.")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--generated", action="store_true", help="delete the exported scene descriptions")
+    parser.add_argument("--scene", action="store_true", help="release the stored scenefile of the job")
+    parser.add_argument("--prefix", default=None, help="only delete generated files starting with this path")
+    parser.add_argument("--store", default=None, help="scene store to remove unused objects from")
+    args = parser.parse_args(args)
+
+    with open(args.manifest, "r") as f:
+        manifest = json.load(f)
+
+    removed, reclaimed = cleanup(
+        manifest, generated=args.generated, scene=args.scene, prefix=args.prefix, storeRoot=args.store
+    )
+    log("removed %s files, reclaimed %.1f MB (%s bytes)" % (removed, reclaimed / 1048576.0, reclaimed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
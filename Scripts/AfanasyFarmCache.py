@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import time
+import logging
+import threading
+
+from qtpy.QtCore import *
+
+
+logger = logging.getLogger(__name__)
+
+
+class FarmMetadataCache(QObject):
+
+    updated = Signal(object)
+    fetched = Signal(object)
+
+    def __init__(self, fetchFunc, cachePath, ttl=300):
+        super(FarmMetadataCache, self).__init__()
+        self.fetchFunc = fetchFunc
+        self.cachePath = cachePath
+        self.ttl = ttl
+        self.data = {}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.fetched.connect(self.onFetched)
+        self.load()
+
+    def load(self):
+        if not self.cachePath or not os.path.exists(self.cachePath):
+            return
+
+        try:
+            with open(self.cachePath, "r") as f:
+                self.data = json.load(f)
+        except (IOError, ValueError) as e:
+            logger.debug("failed to read farm cache %s: %s" % (self.cachePath, e))
+
+    def save(self):
+        if not self.cachePath:
+            return
+
+        folder = os.path.dirname(self.cachePath)
+        try:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+            tmpPath = self.cachePath + ".tmp"
+            with open(tmpPath, "w") as f:
+                json.dump(self.data, f, indent=4)
+
+            os.replace(tmpPath, self.cachePath)
+        except (IOError, OSError) as e:
+            logger.debug("failed to write farm cache %s: %s" % (self.cachePath, e))
+
+    def isStale(self, key):
+        entry = self.data.get(key)
+        return not entry or (time.time() - entry["time"]) > self.ttl
+
+    def get(self, key, default=None):
+        # always answer immediately, fresher data is announced through "updated"
+        if self.isStale(key):
+            self.refresh()
+
+        entry = self.data.get(key)
+        if entry is None:
+            return default
+
+        return entry["value"]
+
+    def isRefreshing(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def refresh(self, blocking=False):
+        with self.lock:
+            if not self.isRefreshing():
+                self.thread = threading.Thread(target=self.fetch)
+                self.thread.daemon = True
+                self.thread.start()
+
+            thread = self.thread
+
+        if blocking:
+            thread.join()
+            QCoreApplication.processEvents()
+
+    def fetch(self):
+        try:
+            result = self.fetchFunc()
+        except Exception as e:
+            logger.debug("failed to fetch farm metadata: %s" % e)
+            return
+
+        if result:
+            self.fetched.emit(result)
+
+    def onFetched(self, result):
+        now = time.time()
+        changed = []
+        for key, value in result.items():
+            entry = self.data.get(key)
+            if not entry or entry["value"] != value:
+                changed.append(key)
+
+            self.data[key] = {"value": value, "time": now}
+
+        self.save()
+        if changed:
+            self.updated.emit(changed)
+
+
+class FarmListModel(QStringListModel):
+    # updated row by row, so views bound to the model keep their current item
+    def __init__(self, items=None, placeholder=None):
+        super(FarmListModel, self).__init__()
+        self.placeholder = placeholder
+        self.setItems(items or [])
+
+    def setItems(self, items):
+        if self.placeholder:
+            items = [self.placeholder] + [item for item in items if item != self.placeholder]
+
+        current = self.stringList()
+        if current == items:
+            return
+
+        for row in reversed(range(len(current))):
+            if current[row] not in items:
+                self.removeRows(row, 1)
+
+        current = self.stringList()
+        for item in items:
+            if item not in current:
+                row = self.rowCount()
+                self.insertRows(row, 1)
+                self.setData(self.index(row), item)
+                current.append(item)
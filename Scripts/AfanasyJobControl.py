@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import socket
+import getpass
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# operation name: (Afanasy action operation, job state expected afterwards)
+JOB_OPERATIONS = {
+    "suspend": ("pause", "OFF"),
+    "resume": ("start", None),
+    "delete": ("delete", None),
+    "priority": (None, None),
+}
+
+
+def getChunks(items, size):
+    for idx in range(0, len(items), size):
+        yield items[idx:idx + size]
+
+
+def getActionRequest(jobIds, operation, value=None):
+    request = {
+        "type": "jobs",
+        "ids": jobIds,
+        "user_name": os.getenv("AF_USERNAME", getpass.getuser()),
+        "host_name": socket.gethostname(),
+    }
+    if operation == "priority":
+        request["params"] = {"priority": int(value)}
+    else:
+        request["operation"] = {"type": JOB_OPERATIONS[operation][0]}
+
+    return request
+
+
+def checkResults(jobIds, operation, value, jobs):
+    # {jobId: (ok, message)} from the job states after the action
+    jobs = dict((jobData["id"], jobData) for jobData in jobs)
+    results = {}
+    for jobId in jobIds:
+        jobData = jobs.get(jobId)
+        if operation == "delete":
+            results[jobId] = (jobData is None, "deleted" if jobData is None else "still exists")
+        elif jobData is None:
+            results[jobId] = (False, "job not found")
+        elif operation == "priority":
+            ok = jobData.get("priority") == int(value)
+            results[jobId] = (ok, "priority %s" % jobData.get("priority"))
+        else:
+            offline = "OFF" in jobData.get("state", "").split()
+            ok = offline if operation == "suspend" else not offline
+            results[jobId] = (ok, jobData.get("state", "").strip())
+
+    return results
+
+
+def runBulkOperation(requestFunc, jobIds, operation, value=None, chunkSize=200):
+    # one action and one check request per chunk of jobs, independent of the number of jobs
+    if operation not in JOB_OPERATIONS:
+        raise ValueError("unknown job operation: %s" % operation)
+
+    jobIds = sorted(set(int(jobId) for jobId in jobIds))
+    results = {}
+    for chunk in getChunks(jobIds, chunkSize):
+        answer = requestFunc("action", getActionRequest(chunk, operation, value))
+        if answer is False:
+            results.update((jobId, (False, "request failed")) for jobId in chunk)
+            continue
+
+        output = requestFunc("get", {"type": "jobs", "ids": chunk})
+        if output is None or output is False:
+            # without the check nothing is known about the jobs, deleted ones stay tracked as well
+            results.update((jobId, (False, "check failed")) for jobId in chunk)
+            continue
+
+        results.update(checkResults(chunk, operation, value, output.get("jobs", [])))
+
+    failed = len([jobId for jobId, result in results.items() if not result[0]])
+    logger.debug("%s of %s jobs: %s failed" % (operation, len(jobIds), failed))
+    return results
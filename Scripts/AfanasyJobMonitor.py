@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+import logging
+import threading
+
+from qtpy.QtCore import *
+from qtpy.QtGui import *
+from qtpy.QtWidgets import *
+
+
+logger = logging.getLogger(__name__)
+
+
+def getJobSummary(jobData):
+    # the fields shown in the monitor, compared between polls to find the changed jobs
+    blocks = jobData.get("blocks", [])
+    tasks = sum(blockData.get("tasks_num", 0) for blockData in blocks)
+    done = sum(blockData.get("p_tasks_done", 0) for blockData in blocks)
+    percent = sum(blockData.get("p_percentage", 0) * blockData.get("tasks_num", 0) for blockData in blocks)
+    return {
+        "name": jobData.get("name", ""),
+        "state": jobData.get("state", "").strip(),
+        "progress": int(percent / tasks) if tasks else 0,
+        "tasks": tasks,
+        "done": done,
+        "running": sum(blockData.get("running_tasks_counter", 0) for blockData in blocks),
+        "errors": sum(blockData.get("p_tasks_error", 0) for blockData in blocks),
+        "priority": jobData.get("priority"),
+    }
+
+
+def isFinished(summary):
+    return "DON" in summary["state"].split()
+
+
+class JobTracker(QObject):
+
+    jobsChanged = Signal(object)
+    polled = Signal(object)
+
+    def __init__(self, requestFunc, interval=10):
+        super(JobTracker, self).__init__()
+        self.requestFunc = requestFunc
+        self.jobs = {}
+        self.thread = None
+        self.polled.connect(self.onPolled)
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self.poll)
+
+    def track(self, jobId, name=None):
+        self.jobs[int(jobId)] = {"name": name or "", "state": "", "progress": 0, "time": time.time()}
+        self.jobsChanged.emit([int(jobId)])
+
+    def untrack(self, jobIds):
+        for jobId in jobIds:
+            self.jobs.pop(int(jobId), None)
+
+        self.jobsChanged.emit([int(jobId) for jobId in jobIds])
+
+    def getActiveJobIds(self):
+        # finished and deleted jobs don't change anymore
+        return sorted(jobId for jobId, summary in self.jobs.items() if not summary.get("final"))
+
+    def start(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+        self.poll()
+
+    def stop(self):
+        self.timer.stop()
+
+    def isPolling(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def poll(self):
+        jobIds = self.getActiveJobIds()
+        if not jobIds or self.isPolling():
+            return
+
+        self.thread = threading.Thread(target=self.fetch, args=(jobIds,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fetch(self, jobIds):
+        # one request for all jobs, independent of the number of tracked jobs
+        try:
+            output = self.requestFunc({"type": "jobs", "ids": jobIds})
+        except Exception as e:
+            logger.debug("failed to poll Afanasy jobs: %s" % e)
+            return
+
+        if output:
+            self.polled.emit((jobIds, output.get("jobs", [])))
+
+    def onPolled(self, result):
+        jobIds, jobs = result
+        changed = []
+        found = set()
+        for jobData in jobs:
+            jobId = jobData["id"]
+            found.add(jobId)
+            if jobId not in self.jobs:
+                continue
+
+            summary = getJobSummary(jobData)
+            summary["final"] = isFinished(summary)
+            if any(self.jobs[jobId].get(key) != value for key, value in summary.items()):
+                summary["time"] = time.time()
+                self.jobs[jobId] = summary
+                changed.append(jobId)
+
+        for jobId in jobIds:
+            if jobId not in found and jobId in self.jobs:
+                self.jobs[jobId].update({"state": "DELETED", "final": True, "time": time.time()})
+                changed.append(jobId)
+
+        if changed:
+            self.jobsChanged.emit(changed)
+
+
+class LoadJobsDialog(QDialog):
+    # the registered jobs of a sequence, shot, product or version, optionally with an operation for all of them
+    operations = [
+        ("Load only", None),
+        ("Suspend", "suspend"),
+        ("Resume", "resume"),
+        ("Priority...", "priority"),
+        ("Delete", "delete"),
+    ]
+
+    def __init__(self, parent=None):
+        super(LoadJobsDialog, self).__init__(parent)
+        self.setWindowTitle("Load Jobs")
+        self.lo_main = QFormLayout()
+        self.setLayout(self.lo_main)
+        self.e_sequence = QLineEdit()
+        self.e_shot = QLineEdit()
+        self.e_product = QLineEdit()
+        self.e_product.setToolTip("The product of exports or the identifier of renders.")
+        self.e_version = QLineEdit()
+        self.cb_operation = QComboBox()
+        self.cb_operation.addItems([label for label, operation in self.operations])
+        self.lo_main.addRow("Sequence:", self.e_sequence)
+        self.lo_main.addRow("Shot:", self.e_shot)
+        self.lo_main.addRow("Product:", self.e_product)
+        self.lo_main.addRow("Version:", self.e_version)
+        self.lo_main.addRow("Operation:", self.cb_operation)
+        self.bb_main = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.bb_main.accepted.connect(self.accept)
+        self.bb_main.rejected.connect(self.reject)
+        self.lo_main.addRow(self.bb_main)
+
+    def getFilters(self):
+        return {
+            "sequence": self.e_sequence.text().strip() or None,
+            "shot": self.e_shot.text().strip() or None,
+            "product": self.e_product.text().strip() or None,
+            "version": self.e_version.text().strip() or None,
+        }
+
+    def getOperation(self):
+        return self.operations[self.cb_operation.currentIndex()][1]
+
+
+class JobMonitorDialog(QDialog):
+    columns = ["ID", "Name", "State", "Progress", "Done", "Running", "Errors"]
+
+    def __init__(self, tracker, parent=None, openLogFunc=None, controlFunc=None, controlSubmittedFunc=None):
+        super(JobMonitorDialog, self).__init__(parent)
+        self.tracker = tracker
+        self.openLogFunc = openLogFunc
+        self.controlFunc = controlFunc
+        self.controlSubmittedFunc = controlSubmittedFunc
+        self.rows = {}
+        self.setWindowTitle("Afanasy Job Monitor")
+        self.loadLayout()
+        self.tracker.jobsChanged.connect(self.onJobsChanged)
+        self.onJobsChanged(list(self.tracker.jobs.keys()))
+        self.tracker.start()
+
+    def loadLayout(self):
+        self.lo_main = QVBoxLayout()
+        self.setLayout(self.lo_main)
+
+        self.tw_jobs = QTableWidget(0, len(self.columns))
+        self.tw_jobs.setHorizontalHeaderLabels(self.columns)
+        self.tw_jobs.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tw_jobs.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.tw_jobs.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tw_jobs.verticalHeader().setVisible(False)
+        self.tw_jobs.horizontalHeader().setStretchLastSection(True)
+        self.tw_jobs.setSortingEnabled(False)
+        self.lo_main.addWidget(self.tw_jobs)
+
+        self.lo_buttons = QHBoxLayout()
+        self.l_status = QLabel()
+        self.b_refresh = QPushButton("Refresh")
+        self.b_refresh.clicked.connect(self.tracker.poll)
+        self.b_removeFinished = QPushButton("Remove finished")
+        self.b_removeFinished.clicked.connect(self.removeFinished)
+        self.lo_buttons.addWidget(self.l_status)
+        self.lo_buttons.addStretch()
+        if self.controlFunc:
+            # applied to all selected jobs at once
+            for label, operation in [
+                ("Suspend", "suspend"),
+                ("Resume", "resume"),
+                ("Priority...", "priority"),
+                ("Delete", "delete"),
+            ]:
+                button = QPushButton(label)
+                button.clicked.connect(lambda checked=False, op=operation: self.controlSelected(op))
+                self.lo_buttons.addWidget(button)
+
+        if self.controlSubmittedFunc:
+            self.b_load = QPushButton("Load Jobs...")
+            self.b_load.clicked.connect(self.loadJobs)
+            self.lo_buttons.addWidget(self.b_load)
+
+        if self.openLogFunc:
+            self.b_log = QPushButton("Show Log...")
+            self.b_log.clicked.connect(self.showLog)
+            self.lo_buttons.addWidget(self.b_log)
+
+        self.lo_buttons.addWidget(self.b_removeFinished)
+        self.lo_buttons.addWidget(self.b_refresh)
+        self.lo_main.addLayout(self.lo_buttons)
+        self.resize(800, 400)
+
+    def getSelectedJobIds(self):
+        rows = set(index.row() for index in self.tw_jobs.selectedIndexes())
+        return [int(self.tw_jobs.item(row, 0).text()) for row in sorted(rows)]
+
+    def selectJobs(self, jobIds):
+        self.tw_jobs.clearSelection()
+        for jobId in jobIds:
+            if jobId in self.rows:
+                self.tw_jobs.selectRow(self.rows[jobId])
+
+    def getOperationValue(self, operation, description):
+        # asks for the priority or the confirmation of a delete, returns (ok, value)
+        if operation == "priority":
+            value, ok = QInputDialog.getInt(self, "Job Priority", "Priority of %s:" % description, 99, 0, 250)
+            return ok, value
+
+        if operation == "delete":
+            result = QMessageBox.question(self, "Delete Jobs", "Delete %s from Afanasy?" % description)
+            return result == QMessageBox.Yes, None
+
+        return True, None
+
+    def controlSelected(self, operation):
+        jobIds = self.getSelectedJobIds()
+        if not jobIds:
+            return
+
+        ok, value = self.getOperationValue(operation, "%s jobs" % len(jobIds))
+        if not ok:
+            return
+
+        self.showResults(operation, self.controlFunc(jobIds, operation, value=value))
+
+    def loadJobs(self):
+        dlg = LoadJobsDialog(self)
+        if not dlg.exec_():
+            return
+
+        filters = dict((key, value) for key, value in dlg.getFilters().items() if value)
+        if not filters:
+            return
+
+        operation = dlg.getOperation()
+        description = "all jobs of %s" % ", ".join("%s %s" % item for item in sorted(filters.items()))
+        ok, value = self.getOperationValue(operation, description)
+        if not ok:
+            return
+
+        # the jobs get tracked, so they stay in the monitor for further operations
+        results = self.controlSubmittedFunc(operation, value=value, **filters)
+        self.selectJobs(sorted(results))
+        if operation:
+            self.showResults(operation, results)
+        else:
+            self.l_status.setText("loaded %s jobs" % len(results))
+            self.tracker.poll()
+
+    def showResults(self, operation, results):
+        failed = ["%s: %s" % (jobId, result[1]) for jobId, result in sorted(results.items()) if not result[0]]
+        if failed:
+            QMessageBox.warning(self, "Afanasy", "%s failed for %s jobs:\n\n%s" % (operation, len(failed), "\n".join(failed)))
+
+        self.l_status.setText("%s: %s of %s jobs done" % (operation, len(results) - len(failed), len(results)))
+        self.tracker.poll()
+
+    def showLog(self):
+        jobIds = self.getSelectedJobIds()
+        if jobIds:
+            self.openLogFunc(jobIds[0], parent=self)
+
+    def removeFinished(self):
+        self.tracker.untrack([jobId for jobId, summary in self.tracker.jobs.items() if summary.get("final")])
+
+    def onJobsChanged(self, jobIds):
+        # only the rows of changed jobs get touched
+        for jobId in jobIds:
+            summary = self.tracker.jobs.get(jobId)
+            if summary is None:
+                self.removeRow(jobId)
+                continue
+
+            if jobId not in self.rows:
+                self.rows[jobId] = self.tw_jobs.rowCount()
+                self.tw_jobs.insertRow(self.rows[jobId])
+                for column in range(len(self.columns)):
+                    self.tw_jobs.setItem(self.rows[jobId], column, QTableWidgetItem())
+
+            row = self.rows[jobId]
+            values = [
+                jobId,
+                summary.get("name", ""),
+                summary.get("state", ""),
+                "%s%%" % summary.get("progress", 0),
+                "%s / %s" % (summary.get("done", 0), summary.get("tasks", 0)),
+                summary.get("running", 0),
+                summary.get("errors", 0),
+            ]
+            for column, value in enumerate(values):
+                self.tw_jobs.item(row, column).setText(str(value))
+
+        active = len(self.tracker.getActiveJobIds())
+        self.l_status.setText("%s jobs, %s active" % (len(self.tracker.jobs), active))
+
+    def removeRow(self, jobId):
+        row = self.rows.pop(jobId, None)
+        if row is None:
+            return
+
+        self.tw_jobs.removeRow(row)
+        for otherId, otherRow in self.rows.items():
+            if otherRow > row:
+                self.rows[otherId] = otherRow - 1
+
+    def closeEvent(self, event):
+        self.tracker.stop()
+        super(JobMonitorDialog, self).closeEvent(event)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class FarmTimeout(Exception):
+    pass
+
+
+class FarmUnavailable(Exception):
+    pass
+
+
+def callWithTimeout(func, timeout, *args, **kwargs):
+    # the worker thread is abandoned on timeout, so a hanging socket can't block the caller
+    result = {}
+
+    def run():
+        try:
+            result["value"] = func(*args, **kwargs)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise FarmTimeout("no answer from the Afanasy server after %s seconds" % timeout)
+
+    if "error" in result:
+        raise result["error"]
+
+    return result.get("value")
+
+
+def isAnswer(result):
+    # afcmd returns None or False when the server refused or didn't answer the request
+    return result is not None and result is not False
+
+
+class CircuitBreaker(object):
+    def __init__(self, probeFunc=None, timeout=5, threshold=3, retryInterval=30):
+        self.probeFunc = probeFunc
+        self.timeout = timeout
+        self.threshold = threshold
+        self.retryInterval = retryInterval
+        self.failures = 0
+        self.isOpen = False
+        self.lock = threading.Lock()
+        self.probeThread = None
+
+    def call(self, func, *args, **kwargs):
+        # isSuccess: refused requests return instead of raising, they count as failures as well
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        isSuccess = kwargs.pop("isSuccess", None) or isAnswer
+        if self.isOpen:
+            raise FarmUnavailable("the Afanasy server is unreachable, retrying in the background")
+
+        try:
+            result = callWithTimeout(func, timeout, *args, **kwargs)
+        except (FarmTimeout, EnvironmentError):
+            self.recordFailure()
+            raise
+
+        if isSuccess(result):
+            self.recordSuccess()
+        else:
+            self.recordFailure()
+
+        return result
+
+    def recordSuccess(self):
+        with self.lock:
+            self.failures = 0
+            self.isOpen = False
+
+    def recordFailure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.threshold or self.isOpen:
+                return
+
+            logger.warning(
+                "Afanasy server failed %s times, failing fast until it is reachable again" % self.failures
+            )
+            self.isOpen = True
+            if self.probeFunc and not (self.probeThread and self.probeThread.is_alive()):
+                self.probeThread = threading.Thread(target=self.probe)
+                self.probeThread.daemon = True
+                self.probeThread.start()
+
+    def probe(self):
+        while self.isOpen:
+            time.sleep(self.retryInterval)
+            try:
+                result = callWithTimeout(self.probeFunc, self.timeout)
+            except Exception as e:
+                logger.debug("Afanasy server still unreachable: %s" % e)
+                continue
+
+            if not isAnswer(result):
+                logger.debug("Afanasy server still refuses requests")
+                continue
+
+            logger.info("Afanasy server is reachable again")
+            self.recordSuccess()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import math
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+EXR_MAGIC = 20000630
+
+# scanlines per chunk of the EXR compression types
+EXR_LINES_PER_CHUNK = {0: 1, 1: 1, 2: 1, 3: 16, 4: 32, 5: 16, 6: 32, 7: 32, 8: 32, 9: 256}
+
+
+def getFrameRegex(path):
+    # "name.####.exr" -> regex matching the file names of the sequence, the frame number is group 1
+    parts = re.split(r"#+", os.path.basename(path), maxsplit=1)
+    if len(parts) != 2:
+        return
+
+    return re.compile("^%s(-?\\d+)%s$" % (re.escape(parts[0]), re.escape(parts[1])))
+
+
+def getFramePath(path, frame):
+    return re.sub(r"#+", lambda m: str(frame).zfill(len(m.group(0))), path, count=1)
+
+
+def parseFrames(frameStr):
+    # "1-3,7,10-20x5" -> [1, 2, 3, 7, 10, 15, 20], negative frames like "-5--3" work as well
+    frames = []
+    for part in str(frameStr).split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+
+        step = 1
+        if "x" in part:
+            part, step = part.split("x", 1)
+            step = max(1, int(step))
+
+        if "-" in part[1:]:
+            idx = part.index("-", 1)
+            frames += list(range(int(part[:idx]), int(part[idx + 1:]) + 1, step))
+        else:
+            frames.append(int(part))
+
+    return frames
+
+
+def scanOutputFrames(path):
+    # one pass over the folder: {frame: size}
+    regex = getFrameRegex(path)
+    folder = os.path.dirname(path)
+    frames = {}
+    if not regex or not os.path.isdir(folder):
+        return frames
+
+    for entry in os.scandir(folder):
+        match = regex.match(entry.name)
+        if match and entry.is_file():
+            frames[int(match.group(1))] = entry.stat().st_size
+
+    return frames
+
+
+def readNullString(f):
+    chars = []
+    while True:
+        char = f.read(1)
+        if not char or char == b"\0":
+            return b"".join(chars).decode("latin-1")
+
+        chars.append(char)
+
+
+def checkExr(path, size):
+    # the header has to be readable and the last chunk has to start inside the file
+    with open(path, "rb") as f:
+        data = f.read(8)
+        if len(data) < 8:
+            return "truncated header"
+
+        magic, version = struct.unpack("<ii", data)
+        if magic != EXR_MAGIC:
+            return "no EXR file"
+
+        if version & 0x1200:
+            # tiled and multipart files: only the header is checked
+            return
+
+        attrs = {}
+        while True:
+            name = readNullString(f)
+            if not name:
+                break
+
+            readNullString(f)
+            data = f.read(4)
+            if len(data) < 4:
+                return "truncated header"
+
+            attrSize = struct.unpack("<i", data)[0]
+            value = f.read(attrSize)
+            if len(value) < attrSize:
+                return "truncated header"
+
+            attrs[name] = value
+
+        if "dataWindow" not in attrs or "compression" not in attrs:
+            return "incomplete header"
+
+        xMin, yMin, xMax, yMax = struct.unpack("<iiii", attrs["dataWindow"])
+        linesPerChunk = EXR_LINES_PER_CHUNK.get(ord(attrs["compression"][:1]), 1)
+        chunks = int(math.ceil((yMax - yMin + 1) / float(linesPerChunk)))
+        data = f.read(8 * chunks)
+        if len(data) < 8 * chunks:
+            return "truncated offset table"
+
+        offsets = struct.unpack("<%sQ" % chunks, data)
+        if not all(offsets) or max(offsets) >= size:
+            return "truncated pixel data"
+
+
+def checkFrame(path):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return "missing"
+
+    if size == 0:
+        return "empty"
+
+    if path.lower().endswith(".exr"):
+        try:
+            return checkExr(path, size)
+        except (IOError, OSError, struct.error) as e:
+            return "unreadable: %s" % e
+
+
+def getBrokenFrames(path, sizes, workers=8):
+    # empty frames are broken, EXR frames also when their header or offset table is truncated
+    frames = sorted(sizes)
+    paths = [getFramePath(path, frame) for frame in frames]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(checkFrame, paths))
+
+    return [frame for frame, error in zip(frames, errors) if error]
+
+
+def getMissingFrames(path, frames, workers=8):
+    sizes = scanOutputFrames(path)
+    frameSet = set(frames)
+    broken = set(getBrokenFrames(path, dict((f, s) for f, s in sizes.items() if f in frameSet), workers))
+    return [frame for frame in frames if frame not in sizes or frame in broken]
+
+
+def getFrameRanges(frames):
+    ranges = []
+    for frame in sorted(set(frames)):
+        if ranges and frame == ranges[-1][1] + 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+
+    return [tuple(frameRange) for frameRange in ranges]
+
+
+def compactFrames(frames):
+    # [1, 2, 3, 7, 9, 10] -> "1-3,7,9-10"
+    return ",".join(
+        str(start) if start == end else "%s-%s" % (start, end) for start, end in getFrameRanges(frames)
+    )
+
+
+def getTaskRanges(frameRanges, framesPerTask):
+    # the tasks of a block in submission order: [(first, last), ...]
+    tasks = []
+    for start, end in frameRanges:
+        for taskStart in range(start, end + 1, framesPerTask):
+            tasks.append((taskStart, min(end, taskStart + framesPerTask - 1)))
+
+    return tasks
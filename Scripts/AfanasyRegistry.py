@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import time
+import getpass
+import hashlib
+import sqlite3
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# job settings that describe what gets rendered, the spec hash is built from these
+SPEC_KEYS = [
+    "Frames",
+    "ChunkSize",
+    "PathS",
+    "ExportCommand",
+    "OutputFilename0",
+    "Pool",
+    "HostsMask",
+    "ExcludeHostsMask",
+    "SceneFile",
+    "AssCompression",
+]
+
+
+def getSpecHash(jobInfos, pluginInfos):
+    spec = dict((key, jobInfos.get(key, pluginInfos.get(key))) for key in SPEC_KEYS)
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SubmissionRegistry(object):
+    columns = [
+        "job_id",
+        "block",
+        "job_name",
+        "product",
+        "version",
+        "sequence",
+        "shot",
+        "context",
+        "frames",
+        "output",
+        "spec_hash",
+        "user",
+        "submitted",
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # the file is shared by everyone on the project, writers wait for each other
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.createTables()
+
+    def createTables(self):
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS submissions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id INTEGER, block TEXT, job_name TEXT, "
+                "product TEXT, version TEXT, sequence TEXT, shot TEXT, context TEXT, frames TEXT, output TEXT, spec_hash TEXT, "
+                "user TEXT, submitted REAL)"
+            )
+            # registries from before the sequence lookup get the columns from their stored context
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(submissions)")]
+            if "sequence" not in columns:
+                self.connection.execute("ALTER TABLE submissions ADD COLUMN sequence TEXT")
+                self.connection.execute("ALTER TABLE submissions ADD COLUMN shot TEXT")
+                rows = self.connection.execute("SELECT id, context FROM submissions").fetchall()
+                updates = []
+                for rowId, context in rows:
+                    context = json.loads(context or "{}")
+                    updates.append((context.get("sequence") or "", context.get("shot") or "", rowId))
+
+                self.connection.executemany("UPDATE submissions SET sequence = ?, shot = ? WHERE id = ?", updates)
+
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS submissions_product ON submissions (product, version)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS submissions_sequence ON submissions (sequence, shot)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS submissions_job ON submissions (job_id)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS submissions_spec ON submissions (spec_hash)"
+            )
+
+    def addSubmission(self, jobId, jobInfos, pluginInfos, context=None):
+        context = context or {}
+        row = (
+            int(jobId),
+            jobInfos.get("BlockName") or jobInfos.get("Name"),
+            jobInfos.get("Name"),
+            # renders are identified by their identifier, exports by their product
+            context.get("product") or context.get("identifier") or "",
+            str(context.get("version", "")),
+            context.get("sequence") or "",
+            context.get("shot") or "",
+            json.dumps(context, default=str),
+            jobInfos.get("Frames"),
+            jobInfos.get("OutputFilename0"),
+            getSpecHash(jobInfos, pluginInfos),
+            getpass.getuser(),
+            time.time(),
+        )
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO submissions (%s) VALUES (%s)"
+                % (", ".join(self.columns), ", ".join(["?"] * len(self.columns))),
+                row,
+            )
+
+    def query(self, where, args):
+        cursor = self.connection.execute(
+            "SELECT %s FROM submissions WHERE %s ORDER BY submitted DESC"
+            % (", ".join(self.columns), where),
+            args,
+        )
+        submissions = []
+        for row in cursor.fetchall():
+            submission = dict(zip(self.columns, row))
+            submission["context"] = json.loads(submission["context"] or "{}")
+            submissions.append(submission)
+
+        return submissions
+
+    def find(self, sequence=None, shot=None, product=None, version=None):
+        # all given filters have to match, without any filter nothing is returned
+        filters = [("sequence", sequence), ("shot", shot), ("product", product), ("version", version)]
+        filters = [(column, str(value)) for column, value in filters if value not in [None, ""]]
+        if not filters:
+            return []
+
+        where = " AND ".join("%s = ?" % column for column, value in filters)
+        return self.query(where, [value for column, value in filters])
+
+    def findByProduct(self, product, version=None):
+        return self.find(product=product, version=version)
+
+    def findBySequence(self, sequence, shot=None):
+        return self.find(sequence=sequence, shot=shot)
+
+    def findByJobId(self, jobId):
+        return self.query("job_id = ?", (int(jobId),))
+
+    def findBySpecHash(self, specHash):
+        return self.query("spec_hash = ?", (specHash,))
+
+    def getJobIds(self, product=None, version=None, sequence=None, shot=None):
+        submissions = self.find(sequence=sequence, shot=shot, product=product, version=version)
+        return sorted(set(submission["job_id"] for submission in submissions))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import sys
+import json
+import uuid
+import errno
+import hashlib
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 8 * 1024 * 1024
+FICLONE = 0x40049409
+
+
+def hashFile(path, chunkSize=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def reflinkFile(src, dst):
+    # copy-on-write clone, supported by btrfs, xfs and other Linux filesystems
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except (IOError, OSError):
+            success = False
+        else:
+            success = True
+
+    if not success:
+        os.remove(dst)
+
+    return success
+
+
+def copyFile(src, dst, chunkSize=CHUNK_SIZE):
+    if reflinkFile(src, dst):
+        return "reflink"
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            chunk = fsrc.read(chunkSize)
+            if not chunk:
+                break
+
+            fdst.write(chunk)
+
+    return "copy"
+
+
+class SceneStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.objectDir = os.path.join(root, "objects")
+        self.refDir = os.path.join(root, "refs")
+        self.indexPath = os.path.join(root, "hashes.json")
+
+    def readIndex(self):
+        if not os.path.exists(self.indexPath):
+            return {}
+
+        try:
+            with open(self.indexPath, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def writeIndex(self, index):
+        tmpPath = "%s.%s.tmp" % (self.indexPath, uuid.uuid4().hex)
+        with open(tmpPath, "w") as f:
+            json.dump(index, f, indent=4)
+
+        os.replace(tmpPath, self.indexPath)
+
+    def getHash(self, path):
+        # reuse the hash of unchanged files, so multi-gigabyte scenes are read once
+        path = os.path.normpath(os.path.abspath(path))
+        stat = os.stat(path)
+        key = path.replace("\\", "/")
+        index = self.readIndex()
+        entry = index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["hash"]
+
+        digest = hashFile(path)
+        index[key] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": digest}
+        try:
+            self.writeIndex(index)
+        except (IOError, OSError) as e:
+            logger.debug("failed to update scene hash index: %s" % e)
+
+        return digest
+
+    def getObjectName(self, path):
+        # the extension stays, DCCs detect the file type from it
+        return self.getHash(path) + os.path.splitext(path)[1].lower()
+
+    def getObjectPath(self, objName):
+        return os.path.join(self.objectDir, objName[:2], objName)
+
+    def addRef(self, objName, jobName):
+        # every job using an object has a ref file, the object is removed after its last ref
+        name = re.sub(r"[^\w.-]", "_", jobName or "job")
+        refPath = os.path.join(self.refDir, objName, "%s_%s" % (name, uuid.uuid4().hex[:8]))
+        makeDirs(os.path.dirname(refPath))
+        with open(refPath, "w") as f:
+            f.write(jobName or "")
+
+        return refPath
+
+    def storeObject(self, path, objName=None):
+        objName = objName or self.getObjectName(path)
+        objPath = self.getObjectPath(objName)
+        if os.path.exists(objPath):
+            return objPath, "reused"
+
+        makeDirs(os.path.dirname(objPath))
+
+        tmpPath = "%s.%s.tmp" % (objPath, uuid.uuid4().hex)
+        try:
+            mode = copyFile(path, tmpPath)
+            os.replace(tmpPath, objPath)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+        return objPath, mode
+
+    def storeScene(self, path, jobName):
+        # the job renders the object itself, returns the object path and the ref of the job
+        objName = self.getObjectName(path)
+        # the ref is added first, so the garbage collection of a cleanup keeps a reused object
+        refPath = self.addRef(objName, jobName)
+        objPath, mode = self.storeObject(path, objName=objName)
+        logger.debug("stored scene %s as %s (%s)" % (path, objPath, mode))
+        return objPath, refPath
+
+
+def makeDirs(folder):
+    if os.path.exists(folder):
+        return
+
+    try:
+        os.makedirs(folder)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Times the State Manager with eager and lazy Afanasy state widgets (project config "lazyStateWidgets").
+# Needs a running Prism session with an empty scene, e.g. from the script editor of Maya:
+#
+# import AfanasyStartupBenchmark
+# AfanasyStartupBenchmark.measureStateStartup(pcore, count=100)
+
+import time
+import logging
+
+from qtpy.QtCore import *
+from qtpy.QtWidgets import *
+
+
+logger = logging.getLogger(__name__)
+
+
+def clearStates(stateManager):
+    for state in list(stateManager.states):
+        stateManager.deleteState(state, silent=True)
+
+    QApplication.processEvents()
+
+
+def measureStateStartup(core, count=100, stateType="ImageRender"):
+    # per mode: creating <count> render states and loading them again from the scene, like opening a shot
+    stateManager = core.getStateManager()
+    if not stateManager:
+        logger.warning("the State Manager is not available")
+        return
+
+    lazyConfig = core.getConfig("Afanasy", "lazyStateWidgets", dft=True, config="project")
+    results = {}
+    try:
+        for lazy in [False, True]:
+            core.setConfig("Afanasy", "lazyStateWidgets", val=lazy, config="project")
+            clearStates(stateManager)
+
+            start = time.time()
+            for idx in range(count):
+                stateManager.createState(stateType)
+
+            QApplication.processEvents()
+            created = time.time() - start
+            stateManager.saveStatesToScene()
+            clearStates(stateManager)
+
+            start = time.time()
+            stateManager.loadStates()
+            QApplication.processEvents()
+            loaded = time.time() - start
+
+            mode = "lazy" if lazy else "eager"
+            results[mode] = {"create": created, "load": loaded, "states": len(stateManager.states)}
+            logger.info(
+                "%s Afanasy state widgets: %s states created in %.3f s, loaded in %.3f s"
+                % (mode, count, created, loaded)
+            )
+    finally:
+        clearStates(stateManager)
+        stateManager.saveStatesToScene()
+        core.setConfig("Afanasy", "lazyStateWidgets", val=lazyConfig, config="project")
+
+    return results
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+from qtpy.QtCore import *
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrameTimingStore(object):
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.connection = sqlite3.connect(path, timeout=10)
+        self.createTables()
+
+    def createTables(self):
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "job_id INTEGER, block TEXT, task INTEGER, shot TEXT, layer TEXT, renderer TEXT, "
+                "frames INTEGER, seconds REAL, finished REAL, "
+                "PRIMARY KEY (job_id, block, task))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_key ON tasks (shot, layer, renderer)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS pending_jobs ("
+                "job_id INTEGER, block TEXT, shot TEXT, layer TEXT, renderer TEXT, "
+                "frames_per_task INTEGER, submitted REAL, PRIMARY KEY (job_id, block))"
+            )
+
+    def addPendingJob(self, jobId, block, shot, layer, renderer, framesPerTask):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pending_jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(jobId), block, shot, layer, renderer, int(framesPerTask), time.time()),
+            )
+
+    def getPendingJobs(self):
+        cursor = self.connection.execute(
+            "SELECT job_id, block, shot, layer, renderer, frames_per_task FROM pending_jobs"
+        )
+        keys = ["jobId", "block", "shot", "layer", "renderer", "framesPerTask"]
+        return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+    def removePendingJobs(self, jobIds):
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM pending_jobs WHERE job_id = ?", [(int(jobId),) for jobId in jobIds]
+            )
+
+    def addTaskTimings(self, rows):
+        # rows: (job_id, block, task, shot, layer, renderer, frames, seconds, finished)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tasks "
+                "(job_id, block, task, shot, layer, renderer, frames, seconds, finished) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def getFrameStats(self, shot, layer, renderer, limit=500):
+        # fall back to other layers of the shot when this layer never rendered
+        queries = [
+            ("shot = ? AND layer = ? AND renderer = ?", (shot, layer, renderer)),
+            ("shot = ? AND renderer = ?", (shot, renderer)),
+        ]
+        for where, args in queries:
+            cursor = self.connection.execute(
+                "SELECT seconds / frames FROM tasks WHERE %s AND frames > 0 "
+                "ORDER BY finished DESC LIMIT ?" % where,
+                args + (limit,),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+
+            seconds = sorted(row[0] for row in rows)
+            return {
+                "samples": len(rows),
+                "secondsPerFrame": seconds[int(len(seconds) / 2)],
+                "slowestSecondsPerFrame": seconds[-1],
+            }
+
+
+def getTaskFrameCount(blockData, taskNum, default):
+    # numeric blocks: the last task only gets the rest of the range
+    if "frame_first" not in blockData or "frame_last" not in blockData:
+        return default
+
+    framesPerTask = max(1, blockData.get("frames_per_task") or default)
+    increment = max(1, blockData.get("frames_inc") or 1)
+    first = blockData["frame_first"] + taskNum * framesPerTask * increment
+    last = min(blockData["frame_last"], first + (framesPerTask - 1) * increment)
+    return max(1, int((last - first) / increment) + 1)
+
+
+def collectTaskTimings(requestFunc, pending):
+    # one request for the states of all pending jobs, the task times only of the finished ones
+    jobIds = sorted(set(item["jobId"] for item in pending))
+    output = requestFunc({"type": "jobs", "ids": jobIds})
+    if not output:
+        return [], []
+
+    jobs = dict((jobData["id"], jobData) for jobData in output.get("jobs", []))
+    # jobs that were deleted never report timings anymore
+    finished = [jobId for jobId in jobIds if jobId not in jobs]
+    rows = []
+    for jobId, jobData in jobs.items():
+        if "DON" not in jobData.get("state", ""):
+            continue
+
+        progress = requestFunc({"type": "jobs", "ids": [jobId], "mode": "progress"})
+        if not progress:
+            continue
+
+        blocks = jobData.get("blocks", [])
+        blockIndices = dict((blockData.get("name"), idx) for idx, blockData in enumerate(blocks))
+        tasksProgress = progress.get("job_progress", {}).get("progress", [])
+        for item in [item for item in pending if item["jobId"] == jobId]:
+            idx = blockIndices.get(item["block"])
+            if idx is None or idx >= len(tasksProgress):
+                continue
+
+            for taskNum, task in enumerate(tasksProgress[idx]):
+                if not task.get("tst") or not task.get("tdn") or "DON" not in task.get("state", "DON"):
+                    continue
+
+                rows.append(
+                    (
+                        jobId,
+                        item["block"],
+                        taskNum,
+                        item["shot"],
+                        item["layer"],
+                        item["renderer"],
+                        getTaskFrameCount(blocks[idx], taskNum, item["framesPerTask"]),
+                        task["tdn"] - task["tst"],
+                        task["tdn"],
+                    )
+                )
+
+        finished.append(jobId)
+
+    return rows, finished
+
+
+class TimingIngest(QObject):
+
+    fetched = Signal(object)
+
+    def __init__(self, store, requestFunc):
+        super(TimingIngest, self).__init__()
+        self.store = store
+        self.requestFunc = requestFunc
+        self.thread = None
+        self.fetched.connect(self.onFetched)
+
+    def start(self):
+        # the sqlite connection belongs to the main thread, only the farm requests run in the background
+        if self.thread and self.thread.is_alive():
+            return
+
+        pending = self.store.getPendingJobs()
+        if not pending:
+            return
+
+        self.thread = threading.Thread(target=self.fetch, args=(pending,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fetch(self, pending):
+        try:
+            result = collectTaskTimings(self.requestFunc, pending)
+        except Exception as e:
+            logger.debug("failed to fetch task timings: %s" % e)
+            return
+
+        self.fetched.emit(result)
+
+    def onFetched(self, result):
+        rows, finished = result
+        self.store.addTaskTimings(rows)
+        self.store.removePendingJobs(finished)
+        logger.debug("ingested %s task timings of %s jobs" % (len(rows), len(finished)))
+
+
+def predictJob(stats, frameCount, maxRunningTasks, targetTaskMinutes=10, timeoutFactor=3):
+    # chunk size so a task takes about <targetTaskMinutes>, timeout with headroom over the slowest task seen
+    secondsPerFrame = max(stats["secondsPerFrame"], 0.001)
+    framesPerTask = int(max(1, min(frameCount, round(targetTaskMinutes * 60 / secondsPerFrame))))
+    # at least one task per running slot, short frames must not end up in a single task on one host
+    if maxRunningTasks > 0:
+        framesPerTask = max(1, min(framesPerTask, int(math.ceil(frameCount / float(maxRunningTasks)))))
+
+    taskCount = int(math.ceil(frameCount / float(framesPerTask)))
+    waves = int(math.ceil(taskCount / float(max(1, maxRunningTasks))))
+    slowest = max(stats["slowestSecondsPerFrame"], secondsPerFrame)
+    return {
+        "framesPerTask": framesPerTask,
+        "timeoutMinutes": int(math.ceil(slowest * framesPerTask * timeoutFactor / 60.0)),
+        "etaSeconds": waves * framesPerTask * secondsPerFrame,
+    }
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import glob
+import json
+import logging
+import threading
+
+from qtpy.QtCore import *
+from qtpy.QtGui import *
+from qtpy.QtWidgets import *
+
+
+logger = logging.getLogger(__name__)
+
+
+def getOutputText(answer):
+    # the key of the task output differs between Afanasy versions
+    if isinstance(answer, str):
+        return answer
+
+    if not isinstance(answer, dict):
+        return ""
+
+    for key in ["task_output", "output", "data", "info", "text"]:
+        if key in answer:
+            return getOutputText(answer[key])
+
+    return ""
+
+
+class TaskLogCache(object):
+    # fetched log text per task run, keyed by (job, block, task, start time) so a restart starts a new log
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def getPath(self, key):
+        return os.path.join(self.folder, "%s_%s_%s_%s.log" % key)
+
+    def getInfoPath(self, key):
+        return os.path.join(self.folder, "%s_%s_%s_%s.json" % key)
+
+    def findLatestKey(self, jobId, blockIdx, taskIdx):
+        # the last run of the task that was fetched before, opened without any request
+        paths = glob.glob(os.path.join(self.folder, "%s_%s_%s_*.log" % (jobId, blockIdx, taskIdx)))
+        if not paths:
+            return
+
+        path = max(paths, key=os.path.getmtime)
+        start = os.path.splitext(os.path.basename(path))[0].rsplit("_", 1)[1]
+        return (jobId, blockIdx, taskIdx, start)
+
+    def getSize(self, key):
+        path = self.getPath(key)
+        return os.path.getsize(path) if key and os.path.exists(path) else 0
+
+    def isFinished(self, key):
+        path = self.getInfoPath(key)
+        if not os.path.exists(path):
+            return False
+
+        with open(path, "r") as f:
+            return json.load(f).get("finished", False)
+
+    def setFinished(self, key, finished=True):
+        with open(self.getInfoPath(key), "w") as f:
+            json.dump({"finished": finished}, f)
+
+    def append(self, key, data):
+        with open(self.getPath(key), "ab") as f:
+            f.write(data)
+
+    def reset(self, key):
+        for path in [self.getPath(key), self.getInfoPath(key)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read(self, key, offset=0, size=None):
+        if not key or not os.path.exists(self.getPath(key)):
+            return b""
+
+        with open(self.getPath(key), "rb") as f:
+            f.seek(max(0, offset))
+            return f.read() if size is None else f.read(size)
+
+
+class TaskLogStream(QObject):
+
+    appended = Signal(object)
+    restarted = Signal()
+    fetched = Signal(object)
+
+    def __init__(self, progressFunc, outputFunc, cache, task, interval=2, maxInterval=30, idleInterval=30):
+        super(TaskLogStream, self).__init__()
+        self.progressFunc = progressFunc
+        self.outputFunc = outputFunc
+        self.cache = cache
+        self.task = task
+        self.key = cache.findLatestKey(*task)
+        self.state = ""
+        self.running = False
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.idleInterval = idleInterval
+        self.thread = None
+        self.fetched.connect(self.onFetched)
+
+    def isFinished(self):
+        return bool(self.key) and not self.running and self.cache.isFinished(self.key)
+
+    def getPollInterval(self):
+        # the server only sends whole logs, the longer the log the less often it gets fetched
+        if not self.running:
+            return self.idleInterval
+
+        size = self.cache.getSize(self.key)
+        return min(self.maxInterval, self.interval * (1 + size / 1048576.0))
+
+    def poll(self):
+        if self.thread and self.thread.is_alive():
+            return
+
+        self.thread = threading.Thread(target=self.fetch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fetch(self):
+        try:
+            progress = self.progressFunc(*self.task)
+            if not progress:
+                self.fetched.emit(None)
+                return
+
+            key = self.task + (progress["start"],)
+            running = "RUN" in progress["state"]
+            text = None
+            # finished runs are complete in the cache, only the cheap progress request is needed
+            if running or not self.cache.isFinished(key):
+                text = self.outputFunc(*self.task)
+        except Exception as e:
+            logger.debug("failed to fetch the task output: %s" % e)
+            self.fetched.emit(None)
+            return
+
+        self.fetched.emit((key, progress["state"], running, text))
+
+    def onFetched(self, result):
+        if not result:
+            return
+
+        key, self.state, self.running, text = result
+        if key != self.key:
+            # a new run of the task, e.g. after an error or a restart
+            self.key = key
+            self.restarted.emit()
+
+        if text is None:
+            return
+
+        # only the part after the cached offset is new
+        data = text.encode("utf-8", "replace")
+        offset = self.cache.getSize(key)
+        if len(data) < offset:
+            self.cache.reset(key)
+            self.restarted.emit()
+            offset = 0
+
+        if len(data) > offset:
+            self.cache.append(key, data[offset:])
+            self.appended.emit(data[offset:].decode("utf-8", "replace"))
+
+        if not self.running and "RDY" not in self.state:
+            self.cache.setFinished(key)
+
+
+class TaskLogDialog(QDialog):
+    def __init__(self, progressFunc, outputFunc, cache, jobId, blockIdx=0, taskIdx=0, parent=None, tailBytes=262144, interval=2):
+        super(TaskLogDialog, self).__init__(parent)
+        self.progressFunc = progressFunc
+        self.outputFunc = outputFunc
+        self.cache = cache
+        self.tailBytes = tailBytes
+        self.interval = interval
+        self.stream = None
+        self.closed = False
+        self.setWindowTitle("Afanasy Task Log")
+        self.loadLayout()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.poll)
+        self.sp_job.setValue(int(jobId))
+        self.sp_block.setValue(blockIdx)
+        self.sp_task.setValue(taskIdx)
+        self.openLog()
+    def loadLayout(self):
+        self.lo_main = QVBoxLayout()
+        self.setLayout(self.lo_main)
+
+        self.lo_task = QHBoxLayout()
+        self.sp_job = QSpinBox()
+        self.sp_job.setMaximum(999999999)
+        self.sp_block = QSpinBox()
+        self.sp_block.setMaximum(9999)
+        self.sp_task = QSpinBox()
+        self.sp_task.setMaximum(999999)
+        self.b_open = QPushButton("Open")
+        self.b_open.clicked.connect(self.openLog)
+        self.chb_follow = QCheckBox("Follow")
+        self.chb_follow.setChecked(True)
+        for label, widget in [("Job:", self.sp_job), ("Block:", self.sp_block), ("Task:", self.sp_task)]:
+            self.lo_task.addWidget(QLabel(label))
+            self.lo_task.addWidget(widget)
+
+        self.lo_task.addWidget(self.b_open)
+        self.lo_task.addStretch()
+        self.lo_task.addWidget(self.chb_follow)
+        self.lo_main.addLayout(self.lo_task)
+
+        self.te_log = QPlainTextEdit()
+        self.te_log.setReadOnly(True)
+        self.te_log.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.te_log.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.lo_main.addWidget(self.te_log)
+
+        self.lo_buttons = QHBoxLayout()
+        self.l_status = QLabel()
+        self.b_full = QPushButton("Load full log")
+        self.b_full.clicked.connect(self.loadFullLog)
+        self.lo_buttons.addWidget(self.l_status)
+        self.lo_buttons.addStretch()
+        self.lo_buttons.addWidget(self.b_full)
+        self.lo_main.addLayout(self.lo_buttons)
+        self.resize(1000, 700)
+
+    def getTask(self):
+        return (self.sp_job.value(), self.sp_block.value(), self.sp_task.value())
+
+    def openLog(self):
+        if self.stream:
+            self.stream.appended.disconnect(self.onAppended)
+            self.stream.restarted.disconnect(self.showCachedLog)
+            self.stream.fetched.disconnect(self.onFetched)
+
+        self.stream = TaskLogStream(
+            self.progressFunc, self.outputFunc, self.cache, self.getTask(), interval=self.interval
+        )
+        self.stream.appended.connect(self.onAppended)
+        self.stream.restarted.connect(self.showCachedLog)
+        self.stream.fetched.connect(self.onFetched)
+        self.showCachedLog()
+        self.poll()
+
+    def showCachedLog(self):
+        # only the end of large logs is shown at first, the cached text opens without any request
+        size = self.cache.getSize(self.stream.key)
+        data = self.cache.read(self.stream.key, offset=size - self.tailBytes)
+        self.te_log.setPlainText(data.decode("utf-8", "replace"))
+        self.b_full.setEnabled(size > self.tailBytes)
+        self.scrollToEnd()
+        self.updateStatus()
+
+    def loadFullLog(self):
+        self.te_log.setPlainText(self.cache.read(self.stream.key).decode("utf-8", "replace"))
+        self.b_full.setEnabled(False)
+        self.scrollToEnd()
+
+    def poll(self):
+        self.stream.poll()
+
+    def onFetched(self, result):
+        # the next poll is planned after each answer, long logs and finished tasks are polled less often
+        self.updateStatus()
+        if not self.closed:
+            self.timer.start(int(self.stream.getPollInterval() * 1000))
+
+    def onAppended(self, text):
+        self.te_log.moveCursor(QTextCursor.End)
+        self.te_log.insertPlainText(text)
+        if self.chb_follow.isChecked():
+            self.scrollToEnd()
+
+        self.updateStatus()
+
+    def scrollToEnd(self):
+        self.te_log.verticalScrollBar().setValue(self.te_log.verticalScrollBar().maximum())
+
+    def updateStatus(self):
+        size = self.cache.getSize(self.stream.key) if self.stream else 0
+        state = self.stream.state.strip() if self.stream and self.stream.state else "unknown"
+        self.l_status.setText("%.1f KB, %s" % (size / 1024.0, state))
+
+    def closeEvent(self, event):
+        self.closed = True
+        self.timer.stop()
+        super(TaskLogDialog, self).closeEvent(event)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Runs on the farm after each render task:
+# checks the output frames of the task, restarts the render task when a frame is broken
+# and appends the result to the verification report of the job.
+#
+# python AfanasyVerify.py --output /renders/shot.####.exr --frames 1-100 --fpt 5 --start 11 --end 15
+#     --block shot_beauty_masterLayer --report shot_beauty_verify.jsonl
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import AfanasyOutputs
+
+
+def log(text):
+    sys.stdout.write("Prism verify - %s\n" % text)
+    sys.stdout.flush()
+
+
+def readReport(path):
+    entries = []
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+
+    return entries
+
+
+def writeReport(path, entry):
+    # one line per task, appends of small lines don't mix between tasks
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def restartTask(jobId, blockName, taskIdx):
+    try:
+        import afcmd
+    except ImportError:
+        log("afcmd is not available, unable to restart task %s" % taskIdx)
+        return False
+
+    output = afcmd._sendRequest("get", {"type": "jobs", "ids": [jobId]}, False) or {}
+    jobs = output.get("jobs", [])
+    blockNames = [blockData.get("name") for blockData in (jobs[0].get("blocks", []) if jobs else [])]
+    if blockName not in blockNames:
+        log("unable to find block %s of job %s" % (blockName, jobId))
+        return False
+
+    request = {
+        "type": "jobs",
+        "ids": [jobId],
+        "block_ids": [blockNames.index(blockName)],
+        "operation": {"type": "restart", "task_ids": [taskIdx]},
+        "user_name": os.getenv("AF_USERNAME", "prism"),
+        "host_name": socket.gethostname(),
+    }
+    afcmd._sendRequest("action", request, False)
+    return True
+
+
+def verify(args):
+    frames = list(range(args.start, args.end + 1))
+    paths = [AfanasyOutputs.getFramePath(args.output, frame) for frame in frames]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        errors = list(pool.map(AfanasyOutputs.checkFrame, paths))
+
+    failed = dict((frame, error) for frame, error in zip(frames, errors) if error)
+    for frame, error in sorted(failed.items()):
+        log("frame %s: %s" % (frame, error))
+
+    frameRanges = AfanasyOutputs.getFrameRanges(AfanasyOutputs.parseFrames(args.frames))
+    tasks = AfanasyOutputs.getTaskRanges(frameRanges, args.fpt)
+    taskIdx = [idx for idx, task in enumerate(tasks) if task[0] <= args.start <= task[1]]
+    entry = {
+        "time": time.time(),
+        "host": socket.gethostname(),
+        "block": args.block,
+        "frames": [args.start, args.end],
+        "checked": len(frames),
+        "failed": dict((str(frame), error) for frame, error in failed.items()),
+        "restarted": False,
+    }
+
+    if failed and taskIdx and args.job_id:
+        # earlier restarts of the same task, broken frames that don't recover only get flagged
+        restarts = len(
+            [
+                e for e in readReport(args.report)
+                if e.get("block") == args.block and e.get("frames") == entry["frames"] and e.get("restarted")
+            ]
+        ) if args.report else 0
+        if restarts < args.max_restarts:
+            entry["restarted"] = restartTask(int(args.job_id), args.block, taskIdx[0])
+            if entry["restarted"]:
+                log("restarted render task %s" % taskIdx[0])
+
+    if args.report:
+        writeReport(args.report, entry)
+
+    log("%s of %s frames ok" % (len(frames) - len(failed), len(frames)))
+    return 1 if failed else 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Check the output frames of a render task.")
+    parser.add_argument("--output", required=True, help="output path with #### for the frame number")
+    parser.add_argument("--start", type=int, required=True)
+    parser.add_argument("--end", type=int, required=True)
+    parser.add_argument("--frames", required=True, help="frames of the render block, e.g. 1-10,15")
+    parser.add_argument("--fpt", type=int, default=1, help="frames per task of the render block")
+    parser.add_argument("--block", required=True, help="name of the render block")
+    parser.add_argument("--job-id", default=os.getenv("AF_JOB_ID"))
+    parser.add_argument("--report", default=None, help="verification report of the job")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-restarts", type=int, default=1)
+    args = parser.parse_args(args)
+    return verify(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,13 +19,23 @@
 # along with Prism.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import time
+
+moduleImportStart = time.time()
+
 import os
+import re
 import sys
+import glob
+import json
+import math
+import tempfile
+import shutil
 import subprocess
-import time
 import logging
 import importlib
 import inspect
+import uuid
 
 from qtpy.QtCore import *
 from qtpy.QtGui import *
@@ -33,35 +43,46 @@ from qtpy.QtWidgets import *
 
 from PrismUtils.Decorators import err_catcher as err_catcher
 
+import AfanasyAssUtils
+import AfanasySceneStore
+import AfanasyFarmCache
+import AfanasyNetwork
+import AfanasyStats
+import AfanasyJobMonitor
+import AfanasyRegistry
+import AfanasyOutputs
+import AfanasyTaskLog
+import AfanasyJobControl
+
 
 logger = logging.getLogger(__name__)
+moduleImportTime = time.time() - moduleImportStart
 
 
 class Prism_Afanasy_Functions(object):
     def __init__(self, core, plugin):
+        initStart = time.time()
         self.core = core
         self.plugin = plugin
-        self.af_path = self.refreshIntegrations()
-        if self.af_path:
-            sys.path.append(os.path.join(self.af_path,"afanasy","python"))
-            sys.path.append(os.path.join(self.af_path,"lib","python"))
-
-            os.environ['CGRU_LOCATION'] = self.af_path
-            import af
-            self.af = af
-            
+        # Afanasy, the DCC modules and the renderer are loaded on the first farm action
+        self.af_path = None
+        self._af = None
+        self._dccModules = {}
+        self._renderName = None
+        self.submittedJobNames = {}
+        self.pipelineStages = []
+        self.timingStore = None
+        self.jobTracker = None
+        self.registry = None
+        self.jobMonitor = None
+
+        self.exportStrategies = ["In Session", "Auto", "Local Parallel", "Farm"]
+        # Afanasy block "sequential" values, 0 runs first, last and middle task and keeps bisecting
+        self.frameOrders = [("Sequential", 1), ("Reverse", -1), ("Coarse to fine", 0)]
         self.coreName = self.core.appPlugin.pluginName
-        if  self.coreName == "Houdini": #to do
-            self.hou = importlib.import_module("hou")
-            self.renderName = "None"
-        elif self.coreName == "Maya":
+        if self.coreName == "Maya":
             self.ass_param = {}
             self.self_prefix = 'meArnoldRender_'
-            self.cmds = importlib.import_module("maya.cmds")
-            self.mel = importlib.import_module("maya.mel")
-
-            render_settings_node = "defaultRenderGlobals"
-            self.renderName =  self.cmds.getAttr(render_settings_node + ".currentRenderer")
             gen_type = "generate_ass"
             self.generate_scenes = getattr(self, gen_type, None)
 
@@ -78,6 +99,9 @@ class Prism_Afanasy_Functions(object):
         )
         self.core.registerCallback("prePublish", self.prePublish, plugin=self.plugin)
         self.core.registerCallback("postPublish", self.postPublish, plugin=self.plugin)
+        self.core.registerCallback(
+            "onProjectBrowserStartup", self.onProjectBrowserStartup, plugin=self.plugin
+        )
         dft = """[expression,#  available variables:
 #  "core" - PrismCore
 #  "context" - dict
@@ -91,6 +115,66 @@ template = base + "_@product@@identifier@_@version@"]"""
 
         data = {"label": "Afanasy Job Name", "key": "@Afanasy_job_name@", "value": dft, "requires": []}
         self.core.projects.addProjectStructureItem("AfanasyJobName", data)
+        logger.debug(
+            "Afanasy plugin: module import %.3f s, initialization %.3f s"
+            % (moduleImportTime, time.time() - initStart)
+        )
+
+    @err_catcher(name=__name__)
+    def loadAfanasy(self):
+        return self.importAfanasy()
+
+    def importAfanasy(self):
+        # no err_catcher here, requests call this from background threads where popups can't be shown
+        if self._af is None:
+            start = time.time()
+            self.af_path = self.refreshIntegrations()
+            if self.af_path:
+                for path in [os.path.join(self.af_path,"afanasy","python"), os.path.join(self.af_path,"lib","python")]:
+                    if path not in sys.path:
+                        sys.path.append(path)
+
+                os.environ['CGRU_LOCATION'] = self.af_path
+                import af
+                self._af = af
+                logger.debug("Afanasy plugin: imported af in %.3f s" % (time.time() - start))
+
+        return self._af
+
+    @property
+    def af(self):
+        return self.loadAfanasy()
+
+    def getDccModule(self, name):
+        if name not in self._dccModules:
+            start = time.time()
+            self._dccModules[name] = importlib.import_module(name)
+            logger.debug("Afanasy plugin: imported %s in %.3f s" % (name, time.time() - start))
+
+        return self._dccModules[name]
+
+    @property
+    def hou(self):
+        return self.getDccModule("hou")
+
+    @property
+    def cmds(self):
+        return self.getDccModule("maya.cmds")
+
+    @property
+    def mel(self):
+        return self.getDccModule("maya.mel")
+
+    @property
+    def renderName(self):
+        if self._renderName is None:
+            if self.coreName == "Maya":
+                render_settings_node = "defaultRenderGlobals"
+                self._renderName = self.cmds.getAttr(render_settings_node + ".currentRenderer")
+            else:
+                self._renderName = "None"
+
+        return self._renderName
 
 
     def refreshIntegrations(self):
@@ -102,46 +186,138 @@ template = base + "_@product@@identifier@_@version@"]"""
         return afPath
         
 
-    def CallAfanasyCommand(self, arguments, hideWindow=True, readStdout=True, silent=False):
+    def getFarmBreaker(self):
+        if not getattr(self, "farmBreaker", None):
+            self.farmBreaker = AfanasyNetwork.CircuitBreaker(
+                probeFunc=lambda: self.sendAfanasyRequest("get", {'type': 'pools', 'ids': None}),
+                timeout=self.core.getConfig("Afanasy", "farmTimeout", dft=5, config="project"),
+                threshold=self.core.getConfig("Afanasy", "farmFailureThreshold", dft=3, config="project"),
+                retryInterval=self.core.getConfig("Afanasy", "farmRetryInterval", dft=30, config="project"),
+            )
+
+        return self.farmBreaker
+
+    def sendAfanasyRequest(self, action, arguments, verbose=False):
+        if not self.importAfanasy():
+            raise EnvironmentError("the Afanasy integration is not installed")
+
+        import afcmd
+        return afcmd._sendRequest(action, arguments, verbose)
+
+    def CallAfanasyCommand(self, arguments, hideWindow=True, readStdout=True, silent=False, action="get"):
         try:
-            import afcmd
-            action = 'get'
             verbose=False
-            arguments['ids'] = None
-            output = afcmd._sendRequest(action, arguments, verbose)
+            arguments.setdefault('ids', None)
+            output = self.getFarmBreaker().call(self.sendAfanasyRequest, action, arguments, verbose)
 
         except Exception as e:
-            if e.errno == 2:
+            if getattr(e, "errno", None) == 2:
                 msg = "Cannot connect to Afanasy. Unable to find the \"Afanasycommand\" executable."
-                if silent:
-                    logger.warning(msg)
-                else:
-                    self.core.popup(msg)
+            elif isinstance(e, (AfanasyNetwork.FarmTimeout, AfanasyNetwork.FarmUnavailable)):
+                msg = "Cannot connect to Afanasy: %s." % e
+            else:
+                msg = "Afanasy request failed: %s" % e
+
+            if silent:
+                logger.warning(msg)
+            else:
+                self.core.popup(msg)
 
-                return False
+            return False
 
         return output
 
+    @err_catcher(name=__name__)
+    def getFarmCache(self):
+        if not getattr(self, "farmCache", None):
+            cachePath = os.path.join(self.core.getUserPrefDir(), "Afanasy", "farmCache.json")
+            ttl = self.core.getConfig("Afanasy", "farmCacheTtl", dft=300, config="project")
+            self.farmCache = AfanasyFarmCache.FarmMetadataCache(self.fetchFarmMetadata, cachePath, ttl=ttl)
+            self.farmCache.updated.connect(self.onFarmMetadataUpdated)
+            self.farmModels = {}
+
+        return self.farmCache
+
+    def fetchFarmMetadata(self):
+        # runs in a background thread, so it must not show any popups
+        output = self.CallAfanasyCommand({'type': 'pools'}, silent=True)
+        if not output or "Error" in output:
+            return
+
+        pools = [poolData['name'] for poolData in output.get('pools', [])]
+
+        output = self.CallAfanasyCommand({'type': 'renders'}, silent=True) or {}
+        renders = []
+        services = set()
+        for renderData in output.get('renders', []):
+            host = renderData.get('host', {})
+            renderServices = [
+                srv['name'] if isinstance(srv, dict) else srv
+                for srv in host.get('services', renderData.get('services', []))
+            ]
+            services.update(renderServices)
+            renders.append(
+                {
+                    "name": renderData.get('name'),
+                    "pool": renderData.get('pool'),
+                    "capacity": renderData.get('capacity', host.get('capacity')),
+                    "cpus": renderData.get('host_resources', {}).get('cpu_num'),
+                    "memory": renderData.get('host_resources', {}).get('mem_total_mb'),
+                }
+            )
+
+        # Afanasy has no render groups, hosts are grouped by their name without the number
+        groups = sorted(set(re.sub(r"[\d_-]+$", "", r["name"]) for r in renders if r["name"]))
+        return {
+            "pools": pools,
+            "groups": groups,
+            "hostMasks": ["%s.*" % group for group in groups if group],
+            "services": sorted(services),
+            "renders": renders,
+        }
+
+    @err_catcher(name=__name__)
+    def getFarmMetadata(self, key):
+        if not hasattr(self.core, "projectPath"):
+            return []
+
+        return self.getFarmCache().get(key) or []
+
+    @err_catcher(name=__name__)
+    def onFarmMetadataUpdated(self, keys):
+        if "pools" in keys:
+            self.core.setConfig("Afanasy", "pools", val=self.getFarmMetadata("pools"), config="project")
+
+        for (key, placeholder), model in self.farmModels.items():
+            if key in keys:
+                model.setItems(self.getFarmMetadata(key))
+
+    @err_catcher(name=__name__)
+    def getFarmModel(self, key, placeholder=None):
+        # one model per list, shared by all combo boxes of the preset items and states
+        self.getFarmCache()
+        if (key, placeholder) not in self.farmModels:
+            if key == "pools":
+                items = self.getAfanasyPools()
+            else:
+                items = self.getFarmMetadata(key)
+
+            self.farmModels[(key, placeholder)] = AfanasyFarmCache.FarmListModel(items, placeholder=placeholder)
+
+        return self.farmModels[(key, placeholder)]
+
     @err_catcher(name=__name__)
     def refreshPools(self):
         if not hasattr(self.core, "projectPath"):
             return
         with self.core.waitPopup(self.core, "Getting pools from Afanasy. Please wait..."):
-            output = self.CallAfanasyCommand({'type': 'pools'}, silent=True)
+            self.getFarmCache().refresh(blocking=True)
 
-        if output and "Error" not in output:
+        return self.getAfanasyPools()
 
-            AfanasyPools = []
-            if output is not None:
-                if 'pools' in output:
-                    for poolData in output['pools']:
-                        print(poolData['name'])
-                        AfanasyPools.append(poolData['name'])
-        else:
-            AfanasyPools = []
-
-        self.core.setConfig("Afanasy", "pools", val=AfanasyPools, config="project")
-        return AfanasyPools
+    @err_catcher(name=__name__)
+    def refreshGroups(self):
+        return self.getAfanasyGroups()
 
     @err_catcher(name=__name__)
     def getRenderer(self):
@@ -154,19 +330,29 @@ template = base + "_@product@@identifier@_@version@"]"""
         if not hasattr(self.core, "projectPath"):
             return
 
-        pools = self.core.getConfig("Afanasy", "pools", config="project")
-        if not pools :
-            self.refreshPools()
+        pools = self.getFarmMetadata("pools")
+        if not pools:
             pools = self.core.getConfig("Afanasy", "pools", config="project")
 
         pools = pools or []
         return pools
 
+    @err_catcher(name=__name__)
+    def getAfanasyGroups(self):
+        return self.getFarmMetadata("groups")
+
+    @err_catcher(name=__name__)
+    def getAfanasyHostMasks(self):
+        return self.getFarmMetadata("hostMasks")
+
+    @err_catcher(name=__name__)
+    def getAfanasyServices(self):
+        return self.getFarmMetadata("services")
+
     @err_catcher(name=__name__)
     def onRefreshPoolsClicked(self, settings):
+        # the preset items are bound to the shared models and update in place
         self.refreshPools()
-        self.refreshGroups()
-        settings.gb_dlPoolPresets.refresh()
 
     @err_catcher(name=__name__)
     def projectSettings_loadUI(self, origin):
@@ -183,6 +369,41 @@ template = base + "_@product@@identifier@_@version@"]"""
         projectSettings.chb_submitScenes.setChecked(True)
         lo_Afanasy.addWidget(projectSettings.chb_submitScenes)
 
+        projectSettings.chb_combineStates = QCheckBox("Submit dependent states as one job")
+        projectSettings.chb_combineStates.setToolTip("When checked all states of a publish are submitted as blocks of one Afanasy job.\nFrame dependencies between the states become per-task block dependencies, so tasks start as soon as their upstream frames are finished.")
+        projectSettings.chb_combineStates.setChecked(False)
+        lo_Afanasy.addWidget(projectSettings.chb_combineStates)
+
+        projectSettings.w_sceneStore = QWidget()
+        projectSettings.lo_sceneStore = QHBoxLayout()
+        projectSettings.lo_sceneStore.setContentsMargins(0, 0, 0, 0)
+        projectSettings.w_sceneStore.setLayout(projectSettings.lo_sceneStore)
+        projectSettings.l_sceneStore = QLabel("Scene Store:")
+        projectSettings.e_sceneStore = QLineEdit()
+        projectSettings.e_sceneStore.setPlaceholderText(self.getDefaultSceneStorePath() or "")
+        projectSettings.e_sceneStore.setToolTip("Folder where submitted scenefiles are stored by content hash.\nIdentical scenefiles are stored only once and shared by all jobs.")
+        projectSettings.lo_sceneStore.addWidget(projectSettings.l_sceneStore)
+        projectSettings.lo_sceneStore.addWidget(projectSettings.e_sceneStore)
+        lo_Afanasy.addWidget(projectSettings.w_sceneStore)
+
+        projectSettings.w_assetCache = QWidget()
+        projectSettings.lo_assetCache = QHBoxLayout()
+        projectSettings.lo_assetCache.setContentsMargins(0, 0, 0, 0)
+        projectSettings.w_assetCache.setLayout(projectSettings.lo_assetCache)
+        projectSettings.l_assetCache = QLabel("Render Node Asset Cache:")
+        projectSettings.e_assetCacheDir = QLineEdit()
+        projectSettings.e_assetCacheDir.setPlaceholderText("$AF_ASSET_CACHE or temp folder")
+        projectSettings.e_assetCacheDir.setToolTip("Local folder on the render nodes, where textures and other job dependencies are cached.")
+        projectSettings.sp_assetCacheSize = QSpinBox()
+        projectSettings.sp_assetCacheSize.setRange(1, 99999)
+        projectSettings.sp_assetCacheSize.setValue(200)
+        projectSettings.sp_assetCacheSize.setSuffix(" GB")
+        projectSettings.sp_assetCacheSize.setToolTip("Maximum size of the cache on each render node. Least recently used files get evicted first.")
+        projectSettings.lo_assetCache.addWidget(projectSettings.l_assetCache)
+        projectSettings.lo_assetCache.addWidget(projectSettings.e_assetCacheDir)
+        projectSettings.lo_assetCache.addWidget(projectSettings.sp_assetCacheSize)
+        lo_Afanasy.addWidget(projectSettings.w_assetCache)
+
         projectSettings.gb_dlPoolPresets = PresetWidget(self)
         projectSettings.gb_dlPoolPresets.setCheckable(True)
         projectSettings.gb_dlPoolPresets.setChecked(False)
@@ -208,6 +429,22 @@ template = base + "_@product@@identifier@_@version@"]"""
                 val = settings["Afanasy"]["submitScenes"]
                 origin.chb_submitScenes.setChecked(val)
 
+            if "combineStates" in settings["Afanasy"]:
+                val = settings["Afanasy"]["combineStates"]
+                origin.chb_combineStates.setChecked(val)
+
+            if "sceneStorePath" in settings["Afanasy"]:
+                val = settings["Afanasy"]["sceneStorePath"]
+                origin.e_sceneStore.setText(val or "")
+
+            if "assetCacheDir" in settings["Afanasy"]:
+                val = settings["Afanasy"]["assetCacheDir"]
+                origin.e_assetCacheDir.setText(val or "")
+
+            if "assetCacheSize" in settings["Afanasy"]:
+                val = settings["Afanasy"]["assetCacheSize"]
+                origin.sp_assetCacheSize.setValue(val)
+
             if "usePoolPresets" in settings["Afanasy"]:
                 val = settings["Afanasy"]["usePoolPresets"]
                 origin.gb_dlPoolPresets.setChecked(val)
@@ -222,192 +459,558 @@ template = base + "_@product@@identifier@_@version@"]"""
         if "Afanasy" not in settings:
             settings["Afanasy"] = {}
             settings["Afanasy"]["submitScenes"] = origin.chb_submitScenes.isChecked()
+            settings["Afanasy"]["combineStates"] = origin.chb_combineStates.isChecked()
+            settings["Afanasy"]["sceneStorePath"] = origin.e_sceneStore.text()
+            settings["Afanasy"]["assetCacheDir"] = origin.e_assetCacheDir.text()
+            settings["Afanasy"]["assetCacheSize"] = origin.sp_assetCacheSize.value()
             settings["Afanasy"]["usePoolPresets"] = origin.gb_dlPoolPresets.isChecked()
             settings["Afanasy"]["poolPresets"] = origin.gb_dlPoolPresets.getPresetData()
 
     @err_catcher(name=__name__)
     def prePublish(self, origin):
+        self.flushStateSave(origin)
+        self.pipelineStages = []
         origin.submittedDlJobs = {}
         origin.submittedDlJobData = {}
 
     @err_catcher(name=__name__)
     def postPublish(self, origin, pubType, result):
+        if self.pipelineStages:
+            jobResult = self.submitPipelineJob()
+            if "Result=Success" not in jobResult:
+                self.core.popup("Failed to submit the combined Afanasy job.")
+
         origin.submittedDlJobs = {}
         origin.submittedDlJobData = {}
 
+    @err_catcher(name=__name__)
+    def onProjectBrowserStartup(self, origin):
+        if not hasattr(origin, "menuTools"):
+            return
+
+        action = QAction("Afanasy Job Monitor...", origin)
+        action.triggered.connect(lambda: self.openJobMonitor(parent=origin))
+        origin.menuTools.addAction(action)
+
+    @err_catcher(name=__name__)
+    def getJobTracker(self):
+        if not self.jobTracker:
+            self.jobTracker = AfanasyJobMonitor.JobTracker(
+                lambda arguments: self.CallAfanasyCommand(arguments, silent=True),
+                interval=self.core.getConfig("Afanasy", "jobMonitorInterval", dft=10, config="project"),
+            )
+
+        return self.jobTracker
+
+    @err_catcher(name=__name__)
+    def openJobMonitor(self, parent=None):
+        if not self.jobMonitor:
+            self.jobMonitor = AfanasyJobMonitor.JobMonitorDialog(
+                self.getJobTracker(),
+                parent=parent,
+                openLogFunc=self.openTaskLog,
+                controlFunc=self.controlJobs,
+                controlSubmittedFunc=self.controlSubmittedJobs,
+            )
+        else:
+            self.getJobTracker().start()
+
+        self.jobMonitor.show()
+        self.jobMonitor.raise_()
+        return self.jobMonitor
+
+    @err_catcher(name=__name__)
+    def controlJobs(self, jobIds, operation, value=None):
+        # operation: suspend, resume, priority (value) or delete, returns {jobId: (ok, message)}
+        results = AfanasyJobControl.runBulkOperation(
+            lambda action, arguments: self.CallAfanasyCommand(arguments, silent=True, action=action),
+            jobIds,
+            operation,
+            value=value,
+            chunkSize=self.core.getConfig("Afanasy", "jobControlChunkSize", dft=200, config="project"),
+        )
+        if operation == "delete":
+            self.getJobTracker().untrack([jobId for jobId, result in results.items() if result[0]])
+
+        return results
+
+    @err_catcher(name=__name__)
+    def controlSubmittedJobs(self, operation, value=None, sequence=None, shot=None, product=None, version=None):
+        # all registered jobs of a sequence, shot, product or version, they get tracked in the job monitor
+        submissions = self.getRegistry().find(sequence=sequence, shot=shot, product=product, version=version)
+        tracker = self.getJobTracker()
+        jobIds = []
+        for submission in submissions:
+            jobId = submission["job_id"]
+            if jobId not in jobIds:
+                jobIds.append(jobId)
+                if jobId not in tracker.jobs:
+                    tracker.track(jobId, submission["job_name"])
+
+        if not operation:
+            return dict((jobId, (True, "")) for jobId in jobIds)
+
+        return self.controlJobs(jobIds, operation, value=value)
+
+    def fetchTaskProgress(self, jobId, blockIdx, taskIdx):
+        # runs in a background thread, the state and start time identify the current run of the task
+        arguments = {'type': 'jobs', 'ids': [int(jobId)], 'block_ids': [blockIdx], 'task_ids': [taskIdx], 'mode': 'progress'}
+        progress = self.CallAfanasyCommand(arguments, silent=True)
+        if not progress:
+            return
+
+        try:
+            taskProgress = progress['job_progress']['progress'][blockIdx][taskIdx]
+        except (KeyError, IndexError, TypeError):
+            return
+
+        return {"state": taskProgress.get('state', ""), "start": taskProgress.get('tst', 0)}
+
+    def fetchTaskOutput(self, jobId, blockIdx, taskIdx):
+        # runs in a background thread, the server always sends the whole output
+        arguments = {'type': 'jobs', 'ids': [int(jobId)], 'block_ids': [blockIdx], 'task_ids': [taskIdx], 'mode': 'output'}
+        output = self.CallAfanasyCommand(arguments, silent=True)
+        if output is False:
+            return
+
+        return AfanasyTaskLog.getOutputText(output)
+
+    @err_catcher(name=__name__)
+    def openTaskLog(self, jobId, blockIdx=0, taskIdx=0, parent=None):
+        if not getattr(self, "taskLogCache", None):
+            self.taskLogCache = AfanasyTaskLog.TaskLogCache(
+                os.path.join(self.core.getUserPrefDir(), "Afanasy", "taskLogs")
+            )
+
+        dlg = AfanasyTaskLog.TaskLogDialog(
+            self.fetchTaskProgress,
+            self.fetchTaskOutput,
+            self.taskLogCache,
+            jobId,
+            blockIdx=blockIdx,
+            taskIdx=taskIdx,
+            parent=parent,
+        )
+        dlg.show()
+        return dlg
+
+    @err_catcher(name=__name__)
+    def getStateKey(self, state):
+        # Houdini states are identified by their ROP, all others by their name in the state manager
+        node = getattr(state, "node", None)
+        if node is not None and hasattr(node, "path"):
+            try:
+                return node.path()
+            except Exception:
+                pass
+
+        if getattr(state, "state", None) is not None and hasattr(state.state, "text"):
+            return state.state.text(0)
+
+        if hasattr(state, "e_name"):
+            return state.e_name.text()
+
+    @err_catcher(name=__name__)
+    def getSubmittingStates(self, origin):
+        # the render states above the dependency state, they get submitted before it
+        states = []
+        for item in getattr(origin.stateManager, "states", []):
+            stateUi = getattr(item, "ui", item)
+            if stateUi is origin:
+                break
+
+            if hasattr(stateUi, "gb_submit"):
+                states.append(stateUi)
+
+        return states
+
+    @err_catcher(name=__name__)
+    def sm_dep_startup(self, origin):
+        if not hasattr(origin, "dlDepStates"):
+            origin.dlDepStates = []
+
+    @err_catcher(name=__name__)
+    def sm_dep_updateUI(self, origin):
+        self.sm_dep_startup(origin)
+        if hasattr(origin, "gb_osDependency"):
+            origin.gb_osDependency.setVisible(False)
+
+        if hasattr(origin, "gb_dlDependency"):
+            origin.gb_dlDependency.setVisible(True)
+
+        origin.tw_caches.blockSignals(True)
+        origin.tw_caches.clear()
+        for state in self.getSubmittingStates(origin):
+            key = self.getStateKey(state)
+            if not key:
+                continue
+
+            item = QTreeWidgetItem(origin.tw_caches, [key])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(0, Qt.Checked if key in origin.dlDepStates else Qt.Unchecked)
+
+        origin.tw_caches.blockSignals(False)
+
+    @err_catcher(name=__name__)
+    def sm_updateDlDeps(self, origin, item, column):
+        self.sm_dep_startup(origin)
+        key = item.text(0)
+        if item.checkState(0) == Qt.Checked and key not in origin.dlDepStates:
+            origin.dlDepStates.append(key)
+        elif item.checkState(0) != Qt.Checked and key in origin.dlDepStates:
+            origin.dlDepStates.remove(key)
+
+        self.requestStateSave(origin)
+
+    @err_catcher(name=__name__)
+    def sm_dlGoToNode(self, item, column):
+        if self.coreName != "Houdini":
+            return
+
+        node = self.hou.node(item.text(0))
+        if node is None:
+            return
+
+        node.setCurrent(True, clear_all_selected=True)
+        paneTab = self.hou.ui.paneTabOfType(self.hou.paneTabType.NetworkEditor)
+        if paneTab is not None:
+            paneTab.frameSelection()
+
     @err_catcher(name=__name__)
     def sm_dep_preExecute(self, origin):
         warnings = []
+        self.sm_dep_startup(origin)
+        if not origin.dlDepStates:
+            warnings.append(["No dependency selected.", "", 2])
 
         return warnings
 
+    @err_catcher(name=__name__)
+    def sm_dep_execute(self, origin, parent):
+        # the job ids the selected states returned in this publish, see sm_render_submitJob
+        self.sm_dep_startup(origin)
+        submitted = getattr(origin.stateManager, "submittedDlJobs", {})
+        jobIds = []
+        for key in origin.dlDepStates:
+            if key not in submitted:
+                logger.warning("state \"%s\" wasn't submitted before the dependency state" % key)
+                continue
+
+            jobIds += submitted[key]
+
+        depType = origin.cb_depType.currentText() if hasattr(origin, "cb_depType") else "Job Completed"
+        dependency = {
+            "type": "frame" if "Frame" in depType else "job",
+            "offset": origin.sp_offset.value() if hasattr(origin, "sp_offset") else 0,
+            "jobids": jobIds,
+        }
+        if not hasattr(parent, "dependencies"):
+            parent.dependencies = []
+
+        parent.dependencies.append(dependency)
+
     @err_catcher(name=__name__)
     def onStateStartup(self, state):
         if state.className == "Dependency":
+            self.sm_dep_startup(state)
             state.tw_caches.itemClicked.connect(
                 lambda x, y: self.sm_updateDlDeps(state, x, y)
             )
             state.tw_caches.itemDoubleClicked.connect(self.sm_dlGoToNode)
         else:
             if hasattr(state, "cb_dlPool"):
-                state.cb_dlPool.addItems(self.getAfanasyPools())
+                state.cb_dlPool.setModel(self.getFarmModel("pools"))
 
             if hasattr(state, "cb_dlGroup"):
-                state.cb_dlGroup.addItems(self.getAfanasyGroups())
+                state.cb_dlGroup.setModel(self.getFarmModel("groups"))
 
             if hasattr(state, "gb_submit"):
-                lo = state.gb_submit.layout()
-
-                state.w_dlRenderer = QWidget()
-                state.lo_dlRenderer = QHBoxLayout()
-                state.lo_dlRenderer.setContentsMargins(0, 0, 0, 0)
-                state.l_dlRenderer = QLabel("Render:")
-                state.cb_dlRenderer = QComboBox()
-                state.cb_dlRenderer.setToolTip("Set active render")
-                state.cb_dlRenderer.setMinimumWidth(150)
-                state.w_dlRenderer.setLayout(state.lo_dlRenderer)
-                state.lo_dlRenderer.addWidget(state.l_dlRenderer)
-                state.lo_dlRenderer.addStretch()
-                state.lo_dlRenderer.addWidget(state.cb_dlRenderer)
-                state.cb_dlRenderer.addItems(self.getRenderer())
-                state.cb_dlRenderer.activated.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_dlRenderer)
-
-                state.w_machineLimit = QWidget()
-                state.lo_machineLimit = QHBoxLayout()
-                state.lo_machineLimit.setContentsMargins(9, 0, 9, 0)
-                state.l_machineLimit = QLabel("Machine Limit:")
-                state.sp_machineLimit = QSpinBox()
-                state.sp_machineLimit.setMaximum(99999)
-                state.w_machineLimit.setLayout(state.lo_machineLimit)
-                state.lo_machineLimit.addWidget(state.l_machineLimit)
-                state.lo_machineLimit.addStretch()
-                state.lo_machineLimit.addWidget(state.sp_machineLimit)
-                state.sp_machineLimit.editingFinished.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_machineLimit)
-
-                state.w_dlPool = QWidget()
-                state.lo_dlPool = QHBoxLayout()
-                state.lo_dlPool.setContentsMargins(9, 0, 9, 0)
-                state.l_dlPool = QLabel("Pool:")
-                state.cb_dlPool = QComboBox()
-                state.cb_dlPool.setToolTip("Afanasy Pool (can be updated in the Prism Project Settings)")
-                state.cb_dlPool.setMinimumWidth(150)
-                state.w_dlPool.setLayout(state.lo_dlPool)
-                state.lo_dlPool.addWidget(state.l_dlPool)
-                state.lo_dlPool.addStretch()
-                state.lo_dlPool.addWidget(state.cb_dlPool)
-                state.cb_dlPool.addItems(self.getAfanasyPools())
-                state.cb_dlPool.activated.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_dlPool)
-
-                state.gb_selected = QGroupBox("Export only selected objects")
-                state.gb_selected.setCheckable(True)
-                state.gb_selected.setChecked(False)
-                lo.addWidget(state.gb_selected)
-
-                state.gb_prioJob = QGroupBox("Use existing .ass files")
-                state.gb_prioJob.setCheckable(True)
-                state.gb_prioJob.setChecked(False)
-                lo.addWidget(state.gb_prioJob)
-
-                state.lo_prioJob = QVBoxLayout()
-                state.gb_prioJob.setLayout(state.lo_prioJob)
-                state.gb_prioJob.toggled.connect(state.stateManager.saveStatesToScene)
-
-                state.w_highPrio = QWidget()
-                state.lo_highPrio = QHBoxLayout()
-                state.l_highPrio = QLabel("Priority:")
-                state.sp_highPrio = QSpinBox()
-                state.sp_highPrio.setMaximum(100)
-                state.sp_highPrio.setValue(70)
-                state.lo_prioJob.addWidget(state.w_highPrio)
-                state.w_highPrio.setLayout(state.lo_highPrio)
-                state.lo_highPrio.addWidget(state.l_highPrio)
-                state.lo_highPrio.addStretch()
-                state.lo_highPrio.addWidget(state.sp_highPrio)
-                state.lo_highPrio.setContentsMargins(0, 0, 0, 0)
-                state.sp_highPrio.editingFinished.connect(state.stateManager.saveStatesToScene)
-
-
-                state.w_generationPt = QWidget()
-                state.lo_generationPt = QHBoxLayout()
-                state.l_generationPt = QLabel("Directory NAme:")
-                state.e_generationPt = QLineEdit()
-                state.e_generationPt.setText("ass")
-                state.b_generationPt = QToolButton()
-                state.b_generationPt.setText("...")
-                state.b_generationPt.setStyleSheet("font: 14pt; text-align: center;")
-                state.b_generationPt.clicked.connect(lambda: self.openFolderDialog(state))
-                state.lo_prioJob.addWidget(state.w_generationPt)
-                state.w_generationPt.setLayout(state.lo_generationPt)
-                state.lo_generationPt.addWidget(state.l_generationPt)
-                state.lo_generationPt.addStretch()
-                state.lo_generationPt.addWidget(state.e_generationPt)
-                state.lo_generationPt.addWidget(state.b_generationPt)
-                state.lo_generationPt.setContentsMargins(0, 0, 0, 0)
-
-                state.gb_cleanup = QGroupBox("cleanup .ass/.vrscenes")
-                state.gb_cleanup.setCheckable(True)
-                state.gb_cleanup.setChecked(False)
-                lo.addWidget(state.gb_cleanup)
-                
-                state.gb_cleanup = QGroupBox("cleanup temp scene")
-                state.gb_cleanup.setCheckable(True)
-                state.gb_cleanup.setChecked(False)
-                lo.addWidget(state.gb_cleanup)
-
-                state.w_hostMask = QWidget()
-                state.lo_hostMask = QHBoxLayout()
-                state.lo_hostMask.setContentsMargins(9, 0, 9, 0)
-                state.l_hostMask = QLabel("Host Mask:")
-                state.e_hostMask = QLineEdit()
-                state.e_hostMask.setMaximumWidth(800)
-                state.w_hostMask.setLayout(state.lo_hostMask)
-                state.lo_hostMask.addWidget(state.l_hostMask)
-                state.lo_hostMask.addStretch()
-                state.lo_hostMask.addWidget(state.e_hostMask)
-                state.e_hostMask.editingFinished.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_hostMask)
-
-                state.w_excludeHostMask = QWidget()
-                state.lo_excludeHostMask = QHBoxLayout()
-                state.lo_excludeHostMask.setContentsMargins(9, 0, 9, 0)
-                state.l_excludeHostMask = QLabel("Exclude Host Mask:")
-                state.e_excludeHostMask = QLineEdit()
-                state.e_excludeHostMask.setMaximumWidth(800)
-                state.w_excludeHostMask.setLayout(state.lo_excludeHostMask)
-                state.lo_excludeHostMask.addWidget(state.l_excludeHostMask)
-                state.lo_excludeHostMask.addStretch()
-                state.lo_excludeHostMask.addWidget(state.e_excludeHostMask)
-                state.e_excludeHostMask.editingFinished.connect(lambda: handleEditingFinished(state, "excludeHostMask"))
-                lo.addWidget(state.w_excludeHostMask)
-
-                state.w_dependMask = QWidget()
-                state.lo_dependMask = QHBoxLayout()
-                state.lo_dependMask.setContentsMargins(9, 0, 9, 0)
-                state.l_dependMask = QLabel("Depend Mask:")
-                state.e_dependMask = QLineEdit()
-                state.e_dependMask.setMaximumWidth(800)
-                state.w_dependMask.setLayout(state.lo_dependMask)
-                state.lo_dependMask.addWidget(state.l_dependMask)
-                state.lo_dependMask.addStretch()
-                state.lo_dependMask.addWidget(state.e_dependMask)
-                state.e_dependMask.editingFinished.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_dependMask)
-
-                state.w_globalDependMask = QWidget()
-                state.lo_globalDependMask = QHBoxLayout()
-                state.lo_globalDependMask.setContentsMargins(9, 0, 9, 0)
-                state.l_globalDependMask = QLabel("Global Depend Mask:")
-                state.e_globalDependMask = QLineEdit()
-                state.e_globalDependMask.setMaximumWidth(800)
-                state.w_globalDependMask.setLayout(state.lo_globalDependMask)
-                state.lo_globalDependMask.addWidget(state.l_globalDependMask)
-                state.lo_globalDependMask.addStretch()
-                state.lo_globalDependMask.addWidget(state.e_globalDependMask)
-                state.e_globalDependMask.editingFinished.connect(state.stateManager.saveStatesToScene)
-                lo.addWidget(state.w_globalDependMask)
+                state.afWidgetsBuilt = False
+                state.afSettings = {}
+                # the Afanasy section is built when the submission gets enabled
+                lazy = self.core.getConfig("Afanasy", "lazyStateWidgets", dft=True, config="project")
+                if not lazy or state.gb_submit.isChecked():
+                    self.buildStateWidgets(state)
+
+                state.gb_submit.toggled.connect(lambda checked: checked and self.buildStateWidgets(state))
+
+    @err_catcher(name=__name__)
+    def buildStateWidgets(self, state):
+        if getattr(state, "afWidgetsBuilt", True):
+            return
+
+        start = time.time()
+        lo = state.gb_submit.layout()
+
+        state.w_dlRenderer = QWidget()
+        state.lo_dlRenderer = QHBoxLayout()
+        state.lo_dlRenderer.setContentsMargins(0, 0, 0, 0)
+        state.l_dlRenderer = QLabel("Render:")
+        state.cb_dlRenderer = QComboBox()
+        state.cb_dlRenderer.setToolTip("Set active render")
+        state.cb_dlRenderer.setMinimumWidth(150)
+        state.w_dlRenderer.setLayout(state.lo_dlRenderer)
+        state.lo_dlRenderer.addWidget(state.l_dlRenderer)
+        state.lo_dlRenderer.addStretch()
+        state.lo_dlRenderer.addWidget(state.cb_dlRenderer)
+        state.cb_dlRenderer.addItems(self.getRenderer())
+        state.cb_dlRenderer.activated.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_dlRenderer)
+
+        state.w_assCompression = QWidget()
+        state.lo_assCompression = QHBoxLayout()
+        state.lo_assCompression.setContentsMargins(9, 0, 9, 0)
+        state.l_assCompression = QLabel(".ass Compression:")
+        state.cb_assCompression = QComboBox()
+        state.cb_assCompression.setToolTip("Compression of the exported .ass files. Gzip writes smaller files at the cost of export and kick load time.")
+        state.cb_assCompression.setMinimumWidth(150)
+        state.w_assCompression.setLayout(state.lo_assCompression)
+        state.lo_assCompression.addWidget(state.l_assCompression)
+        state.lo_assCompression.addStretch()
+        state.lo_assCompression.addWidget(state.cb_assCompression)
+        state.cb_assCompression.addItems(AfanasyAssUtils.getAssCompressionModes())
+        state.cb_assCompression.activated.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_assCompression)
+
+        state.w_machineLimit = QWidget()
+        state.lo_machineLimit = QHBoxLayout()
+        state.lo_machineLimit.setContentsMargins(9, 0, 9, 0)
+        state.l_machineLimit = QLabel("Machine Limit:")
+        state.sp_machineLimit = QSpinBox()
+        state.sp_machineLimit.setMaximum(99999)
+        state.w_machineLimit.setLayout(state.lo_machineLimit)
+        state.lo_machineLimit.addWidget(state.l_machineLimit)
+        state.lo_machineLimit.addStretch()
+        state.lo_machineLimit.addWidget(state.sp_machineLimit)
+        state.sp_machineLimit.editingFinished.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_machineLimit)
+
+        state.chb_dlAutoCapacity = QCheckBox("Size from farm capacity")
+        state.chb_dlAutoCapacity.setToolTip("Query the current capacity of the hosts in the selected pool and host masks and size the maximum running tasks and the task capacity from it.\nA Machine Limit greater than 0 still caps the running tasks.")
+        state.chb_dlAutoCapacity.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlAutoCapacity)
+
+        state.chb_dlAutoChunk = QCheckBox("Auto chunk size from history")
+        state.chb_dlAutoChunk.setToolTip("Choose the frames per task and the task timeout from the render times of earlier jobs of this shot, layer and renderer.\nThe values of the state are used when there is no history yet.")
+        state.chb_dlAutoChunk.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlAutoChunk)
+
+        state.chb_dlResume = QCheckBox("Resume: only missing frames")
+        state.chb_dlResume.setToolTip("Submit only the frames of the range whose output is missing, empty or truncated.")
+        state.chb_dlResume.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlResume)
+
+        state.chb_dlVerify = QCheckBox("Verify outputs")
+        state.chb_dlVerify.setToolTip("Check the size and header of every rendered frame after its task.\nTasks with broken frames get restarted once, the results are written to a report next to the job manifest.")
+        state.chb_dlVerify.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlVerify)
+
+        state.chb_dlProxy = QCheckBox("Proxy previews")
+        state.chb_dlProxy.setToolTip("Write a downscaled JPEG of every finished frame into a \"proxy\" folder next to the output.\nThe proxies are shown as previews of the job in Afanasy.")
+        state.chb_dlProxy.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlProxy)
+
+        if not hasattr(state, "sp_dlConcurrentTasks"):
+            state.w_dlTasksPerHost = QWidget()
+            state.lo_dlTasksPerHost = QHBoxLayout()
+            state.lo_dlTasksPerHost.setContentsMargins(9, 0, 9, 0)
+            state.l_dlTasksPerHost = QLabel("Tasks per Host:")
+            state.sp_dlTasksPerHost = QSpinBox()
+            state.sp_dlTasksPerHost.setRange(1, 256)
+            state.sp_dlTasksPerHost.setToolTip("Number of tasks that run on one host at the same time.\nThe task capacity, the kick thread count and the memory need are split accordingly.")
+            state.w_dlTasksPerHost.setLayout(state.lo_dlTasksPerHost)
+            state.lo_dlTasksPerHost.addWidget(state.l_dlTasksPerHost)
+            state.lo_dlTasksPerHost.addStretch()
+            state.lo_dlTasksPerHost.addWidget(state.sp_dlTasksPerHost)
+            state.sp_dlTasksPerHost.editingFinished.connect(lambda *args: self.requestStateSave(state))
+            lo.addWidget(state.w_dlTasksPerHost)
+
+        state.w_dlPool = QWidget()
+        state.lo_dlPool = QHBoxLayout()
+        state.lo_dlPool.setContentsMargins(9, 0, 9, 0)
+        state.l_dlPool = QLabel("Pool:")
+        state.cb_dlPool = QComboBox()
+        state.cb_dlPool.setToolTip("Afanasy Pool (can be updated in the Prism Project Settings)")
+        state.cb_dlPool.setMinimumWidth(150)
+        state.w_dlPool.setLayout(state.lo_dlPool)
+        state.lo_dlPool.addWidget(state.l_dlPool)
+        state.lo_dlPool.addStretch()
+        state.lo_dlPool.addWidget(state.cb_dlPool)
+        state.cb_dlPool.setModel(self.getFarmModel("pools"))
+        state.cb_dlPool.activated.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_dlPool)
+
+        state.w_dlExportStrategy = QWidget()
+        state.lo_dlExportStrategy = QHBoxLayout()
+        state.lo_dlExportStrategy.setContentsMargins(9, 0, 9, 0)
+        state.l_dlExportStrategy = QLabel("Export:")
+        state.cb_dlExportStrategy = QComboBox()
+        state.cb_dlExportStrategy.setToolTip("Where the .ass files get exported.\nAuto exports one frame first to estimate time and disk space of the full export and picks the strategy from that.")
+        state.cb_dlExportStrategy.setMinimumWidth(150)
+        state.w_dlExportStrategy.setLayout(state.lo_dlExportStrategy)
+        state.lo_dlExportStrategy.addWidget(state.l_dlExportStrategy)
+        state.lo_dlExportStrategy.addStretch()
+        state.lo_dlExportStrategy.addWidget(state.cb_dlExportStrategy)
+        state.cb_dlExportStrategy.addItems(self.exportStrategies)
+        state.cb_dlExportStrategy.activated.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_dlExportStrategy)
+
+        state.w_dlFrameOrder = QWidget()
+        state.lo_dlFrameOrder = QHBoxLayout()
+        state.lo_dlFrameOrder.setContentsMargins(9, 0, 9, 0)
+        state.l_dlFrameOrder = QLabel("Frame Order:")
+        state.cb_dlFrameOrder = QComboBox()
+        state.cb_dlFrameOrder.setToolTip("Order in which the tasks get started.\nCoarse to fine renders the first, last and middle frame first and then bisects the range, so the whole shot can be checked early.")
+        state.cb_dlFrameOrder.setMinimumWidth(150)
+        state.w_dlFrameOrder.setLayout(state.lo_dlFrameOrder)
+        state.lo_dlFrameOrder.addWidget(state.l_dlFrameOrder)
+        state.lo_dlFrameOrder.addStretch()
+        state.lo_dlFrameOrder.addWidget(state.cb_dlFrameOrder)
+        state.cb_dlFrameOrder.addItems([name for name, value in self.frameOrders])
+        state.cb_dlFrameOrder.activated.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_dlFrameOrder)
+
+        state.chb_dlAssetCache = QCheckBox("Cache textures on render nodes")
+        state.chb_dlAssetCache.setToolTip("Sync the scene dependencies into a local cache on the render nodes before rendering, instead of reading them from the file server for every frame.")
+        state.chb_dlAssetCache.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.chb_dlAssetCache)
+
+        state.gb_selected = QGroupBox("Export only selected objects")
+        state.gb_selected.setCheckable(True)
+        state.gb_selected.setChecked(False)
+        lo.addWidget(state.gb_selected)
+
+        state.gb_prioJob = QGroupBox("Use existing .ass files")
+        state.gb_prioJob.setCheckable(True)
+        state.gb_prioJob.setChecked(False)
+        lo.addWidget(state.gb_prioJob)
+
+        state.lo_prioJob = QVBoxLayout()
+        state.gb_prioJob.setLayout(state.lo_prioJob)
+        state.gb_prioJob.toggled.connect(lambda *args: self.requestStateSave(state))
+
+        state.w_highPrio = QWidget()
+        state.lo_highPrio = QHBoxLayout()
+        state.l_highPrio = QLabel("Priority:")
+        state.sp_highPrio = QSpinBox()
+        state.sp_highPrio.setMaximum(100)
+        state.sp_highPrio.setValue(70)
+        state.lo_prioJob.addWidget(state.w_highPrio)
+        state.w_highPrio.setLayout(state.lo_highPrio)
+        state.lo_highPrio.addWidget(state.l_highPrio)
+        state.lo_highPrio.addStretch()
+        state.lo_highPrio.addWidget(state.sp_highPrio)
+        state.lo_highPrio.setContentsMargins(0, 0, 0, 0)
+        state.sp_highPrio.editingFinished.connect(lambda *args: self.requestStateSave(state))
+
+
+        state.w_generationPt = QWidget()
+        state.lo_generationPt = QHBoxLayout()
+        state.l_generationPt = QLabel("Directory NAme:")
+        state.e_generationPt = QLineEdit()
+        state.e_generationPt.setText("ass")
+        state.b_generationPt = QToolButton()
+        state.b_generationPt.setText("...")
+        state.b_generationPt.setStyleSheet("font: 14pt; text-align: center;")
+        state.b_generationPt.clicked.connect(lambda: self.openFolderDialog(state))
+        state.lo_prioJob.addWidget(state.w_generationPt)
+        state.w_generationPt.setLayout(state.lo_generationPt)
+        state.lo_generationPt.addWidget(state.l_generationPt)
+        state.lo_generationPt.addStretch()
+        state.lo_generationPt.addWidget(state.e_generationPt)
+        state.lo_generationPt.addWidget(state.b_generationPt)
+        state.lo_generationPt.setContentsMargins(0, 0, 0, 0)
+
+        state.gb_cleanup = QGroupBox("cleanup .ass/.vrscenes")
+        state.gb_cleanup.setCheckable(True)
+        state.gb_cleanup.setChecked(False)
+        state.gb_cleanup.setToolTip("Delete the exported scene descriptions on the farm after all render tasks of the job finished.")
+        state.gb_cleanup.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.gb_cleanup)
+
+        state.gb_cleanupScene = QGroupBox("cleanup temp scene")
+        state.gb_cleanupScene.setCheckable(True)
+        state.gb_cleanupScene.setChecked(False)
+        state.gb_cleanupScene.setToolTip("Delete the submitted scenefile from the scene store after the job finished.")
+        state.gb_cleanupScene.toggled.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.gb_cleanupScene)
+
+        state.w_hostMask = QWidget()
+        state.lo_hostMask = QHBoxLayout()
+        state.lo_hostMask.setContentsMargins(9, 0, 9, 0)
+        state.l_hostMask = QLabel("Host Mask:")
+        state.e_hostMask = QLineEdit()
+        state.e_hostMask.setMaximumWidth(800)
+        state.w_hostMask.setLayout(state.lo_hostMask)
+        state.lo_hostMask.addWidget(state.l_hostMask)
+        state.lo_hostMask.addStretch()
+        state.lo_hostMask.addWidget(state.e_hostMask)
+        state.e_hostMask.editingFinished.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_hostMask)
+
+        state.w_excludeHostMask = QWidget()
+        state.lo_excludeHostMask = QHBoxLayout()
+        state.lo_excludeHostMask.setContentsMargins(9, 0, 9, 0)
+        state.l_excludeHostMask = QLabel("Exclude Host Mask:")
+        state.e_excludeHostMask = QLineEdit()
+        state.e_excludeHostMask.setMaximumWidth(800)
+        state.w_excludeHostMask.setLayout(state.lo_excludeHostMask)
+        state.lo_excludeHostMask.addWidget(state.l_excludeHostMask)
+        state.lo_excludeHostMask.addStretch()
+        state.lo_excludeHostMask.addWidget(state.e_excludeHostMask)
+        state.e_excludeHostMask.editingFinished.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_excludeHostMask)
+
+        state.w_dependMask = QWidget()
+        state.lo_dependMask = QHBoxLayout()
+        state.lo_dependMask.setContentsMargins(9, 0, 9, 0)
+        state.l_dependMask = QLabel("Depend Mask:")
+        state.e_dependMask = QLineEdit()
+        state.e_dependMask.setMaximumWidth(800)
+        state.w_dependMask.setLayout(state.lo_dependMask)
+        state.lo_dependMask.addWidget(state.l_dependMask)
+        state.lo_dependMask.addStretch()
+        state.lo_dependMask.addWidget(state.e_dependMask)
+        state.e_dependMask.editingFinished.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_dependMask)
+
+        state.w_globalDependMask = QWidget()
+        state.lo_globalDependMask = QHBoxLayout()
+        state.lo_globalDependMask.setContentsMargins(9, 0, 9, 0)
+        state.l_globalDependMask = QLabel("Global Depend Mask:")
+        state.e_globalDependMask = QLineEdit()
+        state.e_globalDependMask.setMaximumWidth(800)
+        state.w_globalDependMask.setLayout(state.lo_globalDependMask)
+        state.lo_globalDependMask.addWidget(state.l_globalDependMask)
+        state.lo_globalDependMask.addStretch()
+        state.lo_globalDependMask.addWidget(state.e_globalDependMask)
+        state.e_globalDependMask.editingFinished.connect(lambda *args: self.requestStateSave(state))
+        lo.addWidget(state.w_globalDependMask)
+
+        state.afWidgetsBuilt = True
+        self.applyStateSettings(state, state.afSettings)
+        logger.debug("Afanasy plugin: built state widgets in %.3f s" % (time.time() - start))
+
+    @err_catcher(name=__name__)
+    def requestStateSave(self, state):
+        # edits are coalesced into one save per burst instead of serializing all states on every change
+        stateManager = state.stateManager
+        timer = getattr(stateManager, "afSaveTimer", None)
+        if timer is None:
+            timer = QTimer()
+            timer.setSingleShot(True)
+            timer.setInterval(self.core.getConfig("Afanasy", "stateSaveDelay", dft=1000, config="project"))
+            timer.timeout.connect(lambda: stateManager.saveStatesToScene())
+            stateManager.afSaveTimer = timer
+
+        timer.start()
+
+    @err_catcher(name=__name__)
+    def flushStateSave(self, stateManager):
+        timer = getattr(stateManager, "afSaveTimer", None)
+        if timer and timer.isActive():
+            timer.stop()
+            stateManager.saveStatesToScene()
 
     @err_catcher(name=__name__)
     def presetChanged(self, state):
@@ -427,7 +1030,7 @@ template = base + "_@product@@identifier@_@version@"]"""
             if idx != -1:
                 state.cb_dlGroup.setCurrentIndex(idx)
 
-        state.stateManager.saveStatesToScene()
+        self.requestStateSave(state)
 
     @err_catcher(name=__name__)
 
@@ -438,14 +1041,58 @@ template = base + "_@product@@identifier@_@version@"]"""
 
     @err_catcher(name=__name__)
     def onStateGetSettings(self, state, settings):
-        if hasattr(state, "gb_submit"):
+        if getattr(state, "className", None) == "Dependency":
+            settings["dl_depStates"] = getattr(state, "dlDepStates", [])
+
+        elif hasattr(state, "gb_submit") and not getattr(state, "afWidgetsBuilt", True):
+            for key, value in state.afSettings.items():
+                settings.setdefault(key, value)
+
+        elif hasattr(state, "gb_submit"):
             settings["dl_machineLimit"] = state.sp_machineLimit.value()
             settings["curdlpool"] = state.cb_dlPool.currentText()
             settings["dl_useSecondJob"] = state.gb_prioJob.isChecked()
             settings["dl_secondJobPrio"] = state.sp_highPrio.value()
+            settings["dl_assCompression"] = state.cb_assCompression.currentText()
+            settings["dl_assetCache"] = state.chb_dlAssetCache.isChecked()
+            settings["dl_exportStrategy"] = state.cb_dlExportStrategy.currentText()
+            settings["dl_frameOrder"] = state.cb_dlFrameOrder.currentText()
+            settings["dl_autoCapacity"] = state.chb_dlAutoCapacity.isChecked()
+            settings["dl_autoChunk"] = state.chb_dlAutoChunk.isChecked()
+            settings["dl_resume"] = state.chb_dlResume.isChecked()
+            settings["dl_verify"] = state.chb_dlVerify.isChecked()
+            settings["dl_proxy"] = state.chb_dlProxy.isChecked()
+            if hasattr(state, "sp_dlTasksPerHost"):
+                settings["dl_tasksPerHost"] = state.sp_dlTasksPerHost.value()
+
+            settings["dl_hostMask"] = state.e_hostMask.text()
+            settings["dl_excludeHostMask"] = state.e_excludeHostMask.text()
+            settings["dl_dependMask"] = state.e_dependMask.text()
+            settings["dl_globalDependMask"] = state.e_globalDependMask.text()
+            settings["dl_cleanupGenerated"] = state.gb_cleanup.isChecked()
+            settings["dl_cleanupScene"] = state.gb_cleanupScene.isChecked()
 
     @err_catcher(name=__name__)
     def onStateSettingsLoaded(self, state, settings):
+        if getattr(state, "className", None) == "Dependency":
+            state.dlDepStates = list(settings.get("dl_depStates", []))
+            if hasattr(state, "tw_caches"):
+                self.sm_dep_updateUI(state)
+
+        elif hasattr(state, "gb_submit") and not getattr(state, "afWidgetsBuilt", True):
+            # applied once the widgets get built
+            for key, value in settings.items():
+                if key.startswith("dl_") or key.startswith("curdl"):
+                    state.afSettings[key] = value
+
+            if state.gb_submit.isChecked():
+                self.buildStateWidgets(state)
+
+        elif hasattr(state, "gb_submit"):
+            self.applyStateSettings(state, settings)
+
+    @err_catcher(name=__name__)
+    def applyStateSettings(self, state, settings):
         if hasattr(state, "gb_submit"):
             if "dl_machineLimit" in settings:
                 state.sp_machineLimit.setValue(settings["dl_machineLimit"])
@@ -471,6 +1118,60 @@ template = base + "_@product@@identifier@_@version@"]"""
             if "dl_secondJobPrio" in settings:
                 state.sp_highPrio.setValue(settings["dl_secondJobPrio"])
 
+            if "dl_assCompression" in settings:
+                idx = state.cb_assCompression.findText(settings["dl_assCompression"])
+                if idx != -1:
+                    state.cb_assCompression.setCurrentIndex(idx)
+
+            if "dl_assetCache" in settings:
+                state.chb_dlAssetCache.setChecked(settings["dl_assetCache"])
+
+            if "dl_cleanupGenerated" in settings:
+                state.gb_cleanup.setChecked(settings["dl_cleanupGenerated"])
+
+            if "dl_cleanupScene" in settings:
+                state.gb_cleanupScene.setChecked(settings["dl_cleanupScene"])
+
+            if "dl_exportStrategy" in settings:
+                idx = state.cb_dlExportStrategy.findText(settings["dl_exportStrategy"])
+                if idx != -1:
+                    state.cb_dlExportStrategy.setCurrentIndex(idx)
+
+            if "dl_frameOrder" in settings:
+                idx = state.cb_dlFrameOrder.findText(settings["dl_frameOrder"])
+                if idx != -1:
+                    state.cb_dlFrameOrder.setCurrentIndex(idx)
+
+            if "dl_tasksPerHost" in settings and hasattr(state, "sp_dlTasksPerHost"):
+                state.sp_dlTasksPerHost.setValue(settings["dl_tasksPerHost"])
+
+            if "dl_autoCapacity" in settings:
+                state.chb_dlAutoCapacity.setChecked(settings["dl_autoCapacity"])
+
+            if "dl_autoChunk" in settings:
+                state.chb_dlAutoChunk.setChecked(settings["dl_autoChunk"])
+
+            if "dl_resume" in settings:
+                state.chb_dlResume.setChecked(settings["dl_resume"])
+
+            if "dl_verify" in settings:
+                state.chb_dlVerify.setChecked(settings["dl_verify"])
+
+            if "dl_proxy" in settings:
+                state.chb_dlProxy.setChecked(settings["dl_proxy"])
+
+            if "dl_hostMask" in settings:
+                state.e_hostMask.setText(settings["dl_hostMask"])
+
+            if "dl_excludeHostMask" in settings:
+                state.e_excludeHostMask.setText(settings["dl_excludeHostMask"])
+
+            if "dl_dependMask" in settings:
+                state.e_dependMask.setText(settings["dl_dependMask"])
+
+            if "dl_globalDependMask" in settings:
+                state.e_globalDependMask.setText(settings["dl_globalDependMask"])
+
             if "dl_poolPreset" in settings:
                 idx = state.cb_dlPreset.findText(settings["dl_poolPreset"])
                 if idx != -1:
@@ -561,6 +1262,29 @@ template = base + "_@product@@identifier@_@version@"]"""
         scenefiles = [curFileName]
         return scenefiles
 
+    @err_catcher(name=__name__)
+    def getDefaultSceneStorePath(self):
+        if not getattr(self.core, "projectPath", None):
+            return
+
+        return os.path.join(self.core.projects.getPipelineFolder(), "Afanasy", "SceneStore")
+
+    @err_catcher(name=__name__)
+    def getSceneStorePath(self):
+        path = self.core.getConfig("Afanasy", "sceneStorePath", config="project")
+        return path or self.getDefaultSceneStorePath()
+
+    @err_catcher(name=__name__)
+    def storeSceneFile(self, jobName):
+        scenePath = self.core.getCurrentFileName()
+        storePath = self.getSceneStorePath()
+        if not scenePath or not os.path.exists(scenePath) or not storePath:
+            return scenePath, None
+
+        # returns the stored scene and the ref of the job on it
+        store = AfanasySceneStore.SceneStore(storePath)
+        return store.storeScene(scenePath, jobName)
+
     @err_catcher(name=__name__)
     def getJobName(self, details=None, origin=None):
         scenefileName = os.path.splitext(self.core.getCurrentFileName(path=False))[0]
@@ -594,15 +1318,18 @@ template = base + "_@product@@identifier@_@version@"]"""
     ):
     
     
+        self.buildStateWidgets(origin)
+        self.flushStateSave(origin.stateManager)
         if self.core.appPlugin.pluginName == "Houdini":
             jobOutputFile = self.processHoudiniPath(origin, jobOutputFile)
 
         if parent:
-            dependencies = parent.dependencies
+            dependencies = getattr(parent, "dependencies", [])
         else:
             dependencies = []
 
         jobOutputFileOrig = jobOutputFile
+        self.startExportFolder()
 
         jobName = self.getJobName(details, origin)
         rangeType = origin.cb_rangeType.currentText()
@@ -615,6 +1342,12 @@ template = base + "_@product@@identifier@_@version@"]"""
         else:
             frameStr = ",".join([str(x) for x in frameRange])
 
+        if origin.chb_dlResume.isChecked():
+            frameStr = self.getResumeFrames(jobOutputFileOrig, frameStr)
+            if not frameStr:
+                self.core.popup("All frames of \"%s\" exist already, nothing to render." % jobName, severity="info")
+                return "Result=Success"
+
         jobPrio = origin.sp_rjPrio.value()
 
         submitScene = self.core.getConfig(
@@ -649,6 +1382,7 @@ template = base + "_@product@@identifier@_@version@"]"""
         jobInfos["MachineLimit"] = jobMachineLimit
         jobInfos["Frames"] = frameStr
         jobInfos["ChunkSize"] = jobFramesPerTask
+        jobInfos["FrameOrder"] = origin.cb_dlFrameOrder.currentText()
         jobInfos["OutputFilename0"] = jobOutputFile
         self.addEnvironmentItem(jobInfos, "prism_project", self.core.prismIni.replace("\\", "/"))
         self.addEnvironmentItem(jobInfos, "prism_source_scene", self.core.getCurrentFileName())
@@ -679,10 +1413,31 @@ template = base + "_@product@@identifier@_@version@"]"""
                     jobInfos["FrameDependencyOffsetStart"] = dependencies[0]["offset"]
 
             elif depType == "file":
+                # Afanasy can't run dependency scripts, the job starts without waiting for the files
+                logger.warning("file dependencies are not supported by Afanasy and will be ignored")
                 jobInfos["ScriptDependencies"] = os.path.abspath(
                     os.path.join(os.path.dirname(__file__), "AfanasyDependency.py")
                 )
 
+        jobInfos["DependMask"] = origin.e_dependMask.text()
+        jobInfos["GlobalDependMask"] = origin.e_globalDependMask.text()
+        jobInfos["HostsMask"] = origin.e_hostMask.text() or self.core.getConfig(
+            "Afanasy", "hostsMask", dft="render.*", config="project"
+        )
+        jobInfos["ExcludeHostsMask"] = origin.e_excludeHostMask.text()
+        if jobConcurrentTasks:
+            tasksPerHost = jobConcurrentTasks
+        elif hasattr(origin, "sp_dlTasksPerHost"):
+            tasksPerHost = origin.sp_dlTasksPerHost.value()
+        else:
+            tasksPerHost = 1
+
+        jobInfos["TasksPerHost"] = tasksPerHost
+        if origin.chb_dlAutoCapacity.isChecked():
+            jobInfos["FarmCapacity"] = self.getFarmCapacity(
+                jobPool, jobInfos["HostsMask"], jobInfos["ExcludeHostsMask"], tasksPerHost=tasksPerHost
+            )
+
         # Create plugin info file
 
         pluginInfos = {}
@@ -694,7 +1449,23 @@ template = base + "_@product@@identifier@_@version@"]"""
         if hasattr(origin, "w_dlGPUdevices") and not origin.w_dlGPUdevices.isHidden():
             pluginInfos["GPUsSelectDevices"] = origin.le_dlGPUdevices.text()
 
-        if not submitScene:
+        if hasattr(origin, "cb_assCompression"):
+            pluginInfos["AssCompression"] = origin.cb_assCompression.currentText()
+
+        if not origin.gb_prioJob.isChecked():
+            strategy = origin.cb_dlExportStrategy.currentText()
+            if strategy == "Auto":
+                strategy = self.probeExportStrategy(jobInfos, pluginInfos)
+                if not strategy:
+                    return "Result=Cancelled"
+
+            # these strategies export from the scene on disk, so it has to be saved before it gets stored
+            if strategy in ["Local Parallel", "Farm"] and not self.ensureSceneSaved(strategy):
+                return "Result=Cancelled"
+
+        if submitScene:
+            pluginInfos["SceneFile"], pluginInfos["SceneRef"] = self.storeSceneFile(jobInfos["Name"])
+        else:
             pluginInfos["SceneFile"] = self.core.getCurrentFileName()
 
 
@@ -703,17 +1474,72 @@ template = base + "_@product@@identifier@_@version@"]"""
         # bake part
 
         if not origin.gb_prioJob.isChecked():
-            arrPath = self.generate_scenes(jobInfos, pluginInfos, arguments)
+            if strategy == "Local Parallel":
+                arrPath = self.generate_ass_local(jobInfos, pluginInfos, arguments)
+                if arrPath is None:
+                    return "Result=Err"
+
+            elif strategy == "Farm":
+                arrPath = self.generate_ass_farm(jobInfos, pluginInfos, arguments)
+            else:
+                arrPath = self.generate_scenes(jobInfos, pluginInfos, arguments)
         else:
             pass
 
-        for i in arrPath:
-            jobInfos["PathS"] = i
+        self.applyTaskPacking(jobInfos, arrPath)
+        pluginInfos["Manifest"] = self.writeJobManifest(
+            jobInfos, pluginInfos, arrPath, collectDependencies=origin.chb_dlAssetCache.isChecked()
+        )
+        if origin.chb_dlAutoChunk.isChecked():
+            self.ingestFrameTimings()
+            self.applyFrameHistory(jobInfos, details, arrPath[0]["layer"] if arrPath else "")
+
+        if int(jobInfos["ChunkSize"]) > 1:
+            self.addChunkingToCommands(pluginInfos, arrPath)
+
+        if origin.chb_dlAssetCache.isChecked():
+            self.addAssetCacheToCommands(pluginInfos, arrPath)
+
+        verifyOutputs = origin.chb_dlVerify.isChecked()
+        proxyPreviews = origin.chb_dlProxy.isChecked()
+        cleanupGenerated = origin.gb_cleanup.isChecked()
+        cleanupScene = origin.gb_cleanupScene.isChecked() and submitScene
+        jobIds = []
+        for idx, layerData in enumerate(arrPath):
+            jobInfos["PathS"] = layerData["command"]
+            jobInfos["BlockName"] = "%s_%s" % (jobInfos["Name"], layerData["layer"])
+            jobInfos["ExportCommand"] = layerData.get("exportCommand")
+            jobInfos["TimingKey"] = self.getTimingKey(details, layerData["layer"])
+            jobInfos["Context"] = details
+            jobInfos["VerifyCommand"] = self.getVerifyCommand(jobInfos, pluginInfos) if verifyOutputs else None
+            jobInfos["ProxyCommand"] = self.getProxyCommand(jobInfos, pluginInfos) if proxyPreviews else None
+            jobInfos["NeedMemory"] = self.getMemoryNeed(layerData)
+            # the scenefile is shared by all layers, so only the last job removes it
+            jobInfos["CleanupCommand"] = self.getCleanupCommand(
+                pluginInfos,
+                layerData,
+                generated=cleanupGenerated,
+                scene=cleanupScene and idx == len(arrPath) - 1,
+            )
 
             if not skipSubmission:
                 result = self.AfanasySubmitJob(jobInfos, pluginInfos, arguments)
+                if "Result=Success" not in result:
+                    return result
+
+                jobId = self.getJobIdFromSubmitResult(result)
+                if jobId:
+                    jobIds.append(jobId)
 
         result ="Result=Success"
+        if jobIds:
+            # dependent states get all layer jobs of this state
+            result += "\nJobID=" + ",".join(jobIds)
+            if not hasattr(origin.stateManager, "submittedDlJobs"):
+                origin.stateManager.submittedDlJobs = {}
+
+            origin.stateManager.submittedDlJobs[self.getStateKey(origin)] = jobIds
+
         return result
 
     def pathGen(self):
@@ -723,6 +1549,22 @@ template = base + "_@product@@identifier@_@version@"]"""
         else:
             path = "error"
         return path
+    @err_catcher(name=__name__)
+    def getExportFolder(self):
+        # every submission exports into its own folder, cleanup of one job never touches the files of another
+        if not getattr(self, "exportFolder", None):
+            self.startExportFolder()
+
+        if not os.path.exists(self.exportFolder):
+            os.makedirs(self.exportFolder)
+
+        return self.exportFolder
+
+    @err_catcher(name=__name__)
+    def startExportFolder(self):
+        name = "%s_%s" % (time.strftime("%Y%m%d_%H%M%S"), uuid.uuid4().hex[:6])
+        self.exportFolder = self.pathGen() + "/" + name
+
     def getImageFileNamePrefix ( self ) :
 
         fileNamePrefix = self.cmds.getAttr('defaultRenderGlobals.imageFilePrefix')
@@ -734,42 +1576,14 @@ template = base + "_@product@@identifier@_@version@"]"""
     def generate_ass(self, jobInfos, pluginInfos, arguments):
         print(jobInfos)
 
-        rangeGet = jobInfos['Frames'].split("-")
-        filename = ""
+        frameRanges = self.getFrameRanges(jobInfos['Frames'])
         assArr = []
-        # save RenderGlobals
-        defGlobals = 'defaultRenderGlobals'
-        aiGlobals = 'defaultArnoldRenderOptions'
         saveGlobals = {}
 
         # override RenderGlobals
-        self.cmds.setAttr(defGlobals + '.animation', 1)  # always use 'name.#.ext' format
-        self.cmds.setAttr(defGlobals + '.outFormatControl', 0)
-        self.cmds.setAttr(defGlobals + '.putFrameBeforeExt', 1)
-        separator = ['none', '.', '_'][1]  # to do
-
-        if separator == 'none':
-            self.cmds.setAttr(defGlobals + '.periodInExt', 0)
-        elif separator == '.':
-            self.cmds.setAttr(defGlobals + '.periodInExt', 1)
-        else:
-            self.cmds.setAttr(defGlobals + '.periodInExt', 2)
-
+        AfanasyAssUtils.applyAssExportSettings(self.cmds)
         image_name = self.getImageFileNamePrefix()
 
-        self.cmds.setAttr(aiGlobals + '.binaryAss', 1)  # to do ass_binary
-        self.cmds.setAttr(aiGlobals + '.expandProcedurals', 1)  # to do
-        self.cmds.setAttr(aiGlobals + '.outputAssBoundingBox', 1)  # to do
-        self.cmds.setAttr(aiGlobals + '.absoluteTexturePaths', 1)  # to do
-        self.cmds.setAttr(aiGlobals + '.absoluteProceduralPaths', 1)  # to do
-        self.cmds.setAttr(aiGlobals + '.plugins_path', "", type='string')  # to do
-        self.cmds.setAttr(aiGlobals + '.procedural_searchpath', "", type='string')  # to do
-        #self.cmds.setAttr(aiGlobals + '.shader_searchpath', "", type='string')  # to do
-        self.cmds.setAttr(aiGlobals + '.texture_searchpath', "", type='string')  # to do
-
-        # Clear .output_ass_filename to force using the default filename from RenderGlobals
-        self.cmds.setAttr(aiGlobals + '.output_ass_filename', '', type='string')
-
         ass_dirname = self.cmds.workspace(fileRuleEntry='ASS')
         if ass_dirname == '':
             ass_dirname = 'ass'
@@ -802,55 +1616,404 @@ template = base + "_@product@@identifier@_@version@"]"""
             
             
             
-            assgen_cmd = 'arnoldExportAss' #+ self.get_assgen_options(layer)
-            assgen_cmd += ' -startFrame %d' % int(rangeGet[0])
-            assgen_cmd += ' -endFrame %d' % int(rangeGet[1])
-            assgen_cmd += ' -frameStep %d' % 1
-            # if ass_deferred:
-                # if ass_binary:
-                    # assgen_cmd += ' -ai:bass 1'
-                # if ass_export_bounds:
-                    # assgen_cmd += ' -ai:exbb 1'
-                    
-			
-			# assgen_cmd += ' -ai:lve 1' # ' -ai:lfv 2'
-			# assgen_cmd += ' -ai:sppg "' + ar_plugin_path + '"'
-			# assgen_cmd += ' -ai:sppr "' + ar_proc_search_path + '"'
-			# assgen_cmd += ' -ai:spsh "' + ar_shader_search_path + '"'
-			# assgen_cmd += ' -ai:sptx "' + ar_tex_search_path + '"'
-			
-
-			# if ass_compressed :
-				# assgen_cmd += ' -compressed'
-
-			# if not ass_binary :
-				# assgen_cmd += ' -asciiAss'
-
-			# if ass_selection :
-				# assgen_cmd += ' -selected'
-
-			# if ass_expand_procedurals :
-				# assgen_cmd += ' -expandProcedurals'
-				
-			# if ass_export_bounds:
-				# assgen_cmd += ' -boundingBox'
-
-            filename += self.pathGen()+ '/' + layer_in_filename
-            assgen_cmd += ' -filename "' + filename + '.ass\"'
-            
-            assArr.append("kick -i " + filename + ".ass") #to do
-            self.mel.eval(assgen_cmd)
+            compression = pluginInfos.get("AssCompression", "None")
+            filename = self.getExportFolder() + '/' + layer_in_filename
+            # one export per contiguous range, resumed jobs may have gaps
+            assgen_cmds = [
+                AfanasyAssUtils.getAssExportCommand(filename, start, end, compression)
+                for start, end in frameRanges
+            ]
+
+            assPattern = filename + ".@####@" + AfanasyAssUtils.getAssExtension(compression)
+            assArr.append(
+                {
+                    "layer": layer_in_filename,
+                    "filename": filename,
+                    "compression": compression,
+                    "command": 'kick -i "%s"' % assPattern,
+                }
+            )
+            for assgen_cmd in assgen_cmds:
+                self.mel.eval(assgen_cmd)
 
             self.cmds.setAttr(layer + '.renderable', saveGlobals['renderableLayer'])
 
         if exportAllRenderLayers:
             # restore the current layer
-            cmds.editRenderLayerGlobals(currentRenderLayer=current_layer)
+            self.cmds.editRenderLayerGlobals(currentRenderLayer=current_layer)
         
         return assArr
 
 
 
+    @err_catcher(name=__name__)
+    def getFrameList(self, frameStr):
+        return AfanasyOutputs.parseFrames(frameStr)
+
+    @err_catcher(name=__name__)
+    def getFrameRanges(self, frameStr):
+        return AfanasyOutputs.getFrameRanges(self.getFrameList(frameStr))
+
+    @err_catcher(name=__name__)
+    def getResumeFrames(self, outputPath, frameStr):
+        frames = self.getFrameList(frameStr)
+        missing = AfanasyOutputs.getMissingFrames(outputPath, frames)
+        logger.info("resume: %s of %s frames are missing or broken" % (len(missing), len(frames)))
+        return AfanasyOutputs.compactFrames(missing)
+
+    @err_catcher(name=__name__)
+    def getTaskCommand(self, command, start, end):
+        # what Afanasy does for numeric blocks: first @#@ is the first, second @#@ the last frame of the task
+        command = command.replace("@#@", str(start), 1).replace("@#@", str(end), 1)
+        return re.sub(r"@(#+)@", lambda m: str(start).zfill(len(m.group(1))), command)
+
+    @err_catcher(name=__name__)
+    def setBlockOrder(self, block, jobInfos):
+        sequential = dict(self.frameOrders).get(jobInfos.get("FrameOrder"), 1)
+        if sequential != 1:
+            block.setSequential(sequential)
+
+    @err_catcher(name=__name__)
+    def setBlockFrames(self, block, command, frameRanges, framesPerTask):
+        # numeric blocks cover one range only, gaps need explicit tasks
+        if len(frameRanges) == 1:
+            block.setCommand(command)
+            block.setNumeric(frameRanges[0][0], frameRanges[0][1], framesPerTask)
+            return
+
+        for taskStart, taskEnd in AfanasyOutputs.getTaskRanges(frameRanges, framesPerTask):
+            name = str(taskStart) if taskStart == taskEnd else "%s-%s" % (taskStart, taskEnd)
+            task = self.af.Task(name)
+            task.setCommand(self.getTaskCommand(command, taskStart, taskEnd))
+            block.tasks.append(task)
+
+    @err_catcher(name=__name__)
+    def getCurrentLayerName(self):
+        layer = self.cmds.editRenderLayerGlobals(q=True, currentRenderLayer=True)
+        return layer, "masterLayer" if layer == "defaultRenderLayer" else layer
+
+    @err_catcher(name=__name__)
+    def getMayapy(self, farm=False):
+        if farm:
+            return self.core.getConfig("Afanasy", "farmMayapy", dft="mayapy", config="project")
+
+        exe = "mayapy.exe" if sys.platform == "win32" else "mayapy"
+        return os.path.join(os.path.dirname(sys.executable), exe)
+
+    @err_catcher(name=__name__)
+    def probeAssExport(self, jobInfos, pluginInfos):
+        frames = self.getFrameList(jobInfos["Frames"])
+        frame = frames[int(len(frames) / 2)]
+        compression = pluginInfos.get("AssCompression", "None")
+        folder = tempfile.mkdtemp(prefix="afProbe_")
+        try:
+            AfanasyAssUtils.applyAssExportSettings(self.cmds)
+            filename = os.path.join(folder, "probe").replace("\\", "/")
+            start = time.time()
+            self.mel.eval(AfanasyAssUtils.getAssExportCommand(filename, frame, frame, compression))
+            duration = time.time() - start
+            size = sum(
+                os.path.getsize(f)
+                for f in AfanasyAssUtils.getExportedAssFiles(filename, compression)
+            )
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        probe = {
+            "frame": frame,
+            "seconds": duration,
+            "bytes": size,
+            "estSeconds": duration * len(frames),
+            "estBytes": size * len(frames),
+        }
+        logger.debug("export probe: %s" % probe)
+        return probe
+
+    @err_catcher(name=__name__)
+    def chooseExportStrategy(self, probe):
+        sessionLimit = self.core.getConfig("Afanasy", "probeSessionLimit", dft=120, config="project")
+        localLimit = self.core.getConfig("Afanasy", "probeLocalLimit", dft=1800, config="project")
+        if probe["estSeconds"] <= sessionLimit:
+            return "In Session"
+        elif probe["estSeconds"] <= localLimit:
+            return "Local Parallel"
+        else:
+            return "Farm"
+
+    @err_catcher(name=__name__)
+    def probeExportStrategy(self, jobInfos, pluginInfos):
+        probe = self.probeAssExport(jobInfos, pluginInfos)
+        strategy = self.chooseExportStrategy(probe)
+        folder = os.path.dirname(self.pathGen())
+        free = shutil.disk_usage(folder).free if os.path.exists(folder) else None
+        if free is not None and probe["estBytes"] > free:
+            msg = (
+                "The export of \"%s\" needs about %.1f GB, but only %.1f GB are free on the target volume:\n\n%s\n\nContinue anyway?"
+                % (jobInfos["Name"], probe["estBytes"] / 1024.0 ** 3, free / 1024.0 ** 3, folder)
+            )
+            result = self.core.popupQuestion(msg, buttons=["Continue", "Cancel"], icon=QMessageBox.Warning)
+            if result != "Continue":
+                return
+
+        logger.info(
+            "estimated export: %.0f s, %.1f MB - using strategy \"%s\""
+            % (probe["estSeconds"], probe["estBytes"] / 1048576.0, strategy)
+        )
+        return strategy
+
+    @err_catcher(name=__name__)
+    def ensureSceneSaved(self, strategy):
+        if self.coreName != "Maya" or not self.cmds.file(q=True, modified=True):
+            return True
+
+        msg = (
+            "The scene has unsaved changes. The \"%s\" export reads the scene from disk and would miss them.\n\nSave the scene and continue?"
+            % strategy
+        )
+        result = self.core.popupQuestion(msg, buttons=["Save", "Cancel"], icon=QMessageBox.Warning)
+        if result != "Save":
+            return False
+
+        return bool(self.core.saveScene(versionUp=False, prismReq=False))
+
+    @err_catcher(name=__name__)
+    def generate_ass_local(self, jobInfos, pluginInfos, arguments):
+        frames = self.getFrameList(jobInfos["Frames"])
+        compression = pluginInfos.get("AssCompression", "None")
+        layer, layerName = self.getCurrentLayerName()
+        filename = self.getExportFolder() + "/" + layerName
+        workers = self.core.getConfig("Afanasy", "localExportWorkers", dft=4, config="project")
+        chunkSize = max(1, int(math.ceil(len(frames) / float(workers))))
+        script = os.path.join(os.path.dirname(__file__), "AfanasyAssUtils.py")
+
+        procs = []
+        chunks = []
+        for idx in range(0, len(frames), chunkSize):
+            chunk = frames[idx:idx + chunkSize]
+            chunks.append(chunk)
+            cmd = [
+                self.getMayapy(),
+                script,
+                "export",
+                "--scene", pluginInfos["SceneFile"],
+                "--filename", filename,
+                "--start", str(chunk[0]),
+                "--end", str(chunk[-1]),
+                "--compression", compression,
+                "--layer", layer,
+            ]
+            procs.append(subprocess.Popen(cmd))
+
+        with self.core.waitPopup(self.core, "Exporting .ass files in %s processes. Please wait..." % len(procs)):
+            results = [proc.wait() for proc in procs]
+
+        if any(results):
+            # the render tasks would fail on the missing .ass files
+            failed = [
+                "frames %s-%s: exit code %s" % (chunk[0], chunk[-1], code)
+                for chunk, code in zip(chunks, results) if code
+            ]
+            msg = "The local .ass export failed in %s of %s processes:\n\n%s\n\nThe job was not submitted." % (
+                len(failed), len(procs), "\n".join(failed)
+            )
+            self.core.popup(msg)
+            return
+
+        assPattern = filename + ".@####@" + AfanasyAssUtils.getAssExtension(compression)
+        return [
+            {
+                "layer": layerName,
+                "filename": filename,
+                "compression": compression,
+                "command": 'kick -i "%s"' % assPattern,
+            }
+        ]
+
+    @err_catcher(name=__name__)
+    def generate_ass_farm(self, jobInfos, pluginInfos, arguments):
+        compression = pluginInfos.get("AssCompression", "None")
+        layer, layerName = self.getCurrentLayerName()
+        filename = self.getExportFolder() + "/" + layerName
+        script = self.stageFarmScript("AfanasyAssUtils.py", self.getExportFolder())
+        # Afanasy replaces the first @#@ with the first and the second with the last frame of a task
+        exportCmd = '%s "%s" export --scene "%s" --filename "%s" --start @#@ --end @#@ --compression %s --layer %s' % (
+            self.getMayapy(farm=True),
+            script,
+            pluginInfos["SceneFile"].replace("\\", "/"),
+            filename,
+            compression,
+            layer,
+        )
+        assPattern = filename + ".@####@" + AfanasyAssUtils.getAssExtension(compression)
+        return [
+            {
+                "layer": layerName,
+                "filename": filename,
+                "compression": compression,
+                "command": 'kick -i "%s"' % assPattern,
+                "exportCommand": exportCmd,
+            }
+        ]
+
+    @err_catcher(name=__name__)
+    def expandFilePath(self, path):
+        pattern = re.sub(r"<udim>|<UDIM>|<tile>|<f>|#+", "*", path)
+        if pattern == path:
+            return [path] if os.path.isfile(path) else []
+
+        return glob.glob(pattern)
+
+    @err_catcher(name=__name__)
+    def getSceneDependencies(self):
+        if self.coreName != "Maya":
+            return []
+
+        attrs = {"file": "fileTextureName", "aiImage": "filename", "aiStandIn": "dso"}
+        paths = set()
+        for nodeType, attr in attrs.items():
+            for node in self.cmds.ls(type=nodeType) or []:
+                path = self.cmds.getAttr(node + "." + attr)
+                if path:
+                    paths.add(path)
+
+        files = set()
+        for path in paths:
+            for filepath in self.expandFilePath(path):
+                files.add(os.path.normpath(filepath))
+                txPath = os.path.splitext(filepath)[0] + ".tx"
+                if os.path.isfile(txPath):
+                    files.add(os.path.normpath(txPath))
+
+        dependencies = []
+        for filepath in sorted(files):
+            stat = os.stat(filepath)
+            dependencies.append({"path": filepath, "size": stat.st_size, "mtime": stat.st_mtime})
+
+        return dependencies
+
+    @err_catcher(name=__name__)
+    def writeJobManifest(self, jobInfos, pluginInfos, layers, collectDependencies=False):
+        # only the files of this job's frames, never a scan of the folder
+        generated = []
+        frames = self.getFrameList(jobInfos["Frames"])
+        for layerData in layers:
+            generated += AfanasyAssUtils.getExpectedAssFiles(
+                layerData["filename"], layerData["compression"], frames
+            )
+
+        manifest = {
+            "version": 1,
+            "job": jobInfos["Name"],
+            "scene": pluginInfos.get("SceneFile"),
+            "sceneRef": pluginInfos.get("SceneRef"),
+            "generated": generated,
+            # scanning the textures on the file server is only worth it for the asset cache
+            "dependencies": self.getSceneDependencies() if collectDependencies else [],
+        }
+
+        name = re.sub(r"[^\w.-]", "_", jobInfos["Name"])
+        path = os.path.join(self.getExportFolder(), "%s_manifest.json" % name)
+
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=4)
+
+        return path
+
+    @err_catcher(name=__name__)
+    def stageFarmScript(self, scriptName, folder):
+        # the render nodes can't access the local plugin folder
+        target = os.path.join(folder, scriptName)
+        shutil.copyfile(os.path.join(os.path.dirname(__file__), scriptName), target)
+        return target.replace("\\", "/")
+
+    @err_catcher(name=__name__)
+    def getFarmPython(self):
+        return self.core.getConfig("Afanasy", "farmPython", dft="python", config="project")
+
+    @err_catcher(name=__name__)
+    def addAssetCacheToCommands(self, pluginInfos, layers):
+        script = self.stageFarmScript("AfanasyAssetCache.py", os.path.dirname(pluginInfos["Manifest"]))
+        cacheDir = self.core.getConfig("Afanasy", "assetCacheDir", config="project")
+        cacheSize = self.core.getConfig("Afanasy", "assetCacheSize", dft=200, config="project")
+        wrapper = '%s "%s" --manifest "%s" --max-size %s' % (
+            self.getFarmPython(),
+            script,
+            pluginInfos["Manifest"].replace("\\", "/"),
+            cacheSize,
+        )
+        if cacheDir:
+            wrapper += ' --cache-dir "%s"' % cacheDir
+
+        for layerData in layers:
+            layerData["command"] = wrapper + " -- " + layerData["command"]
+
+    @err_catcher(name=__name__)
+    def getVerifyCommand(self, jobInfos, pluginInfos):
+        folder = os.path.dirname(pluginInfos["Manifest"])
+        self.stageFarmScript("AfanasyOutputs.py", folder)
+        script = self.stageFarmScript("AfanasyVerify.py", folder)
+        report = os.path.join(folder, "%s_verify.jsonl" % jobInfos["BlockName"]).replace("\\", "/")
+        return '%s "%s" --output "%s" --start @#@ --end @#@ --frames %s --fpt %s --block "%s" --report "%s" --workers %s' % (
+            self.getFarmPython(),
+            script,
+            jobInfos["OutputFilename0"].replace("\\", "/"),
+            jobInfos["Frames"],
+            max(1, int(jobInfos.get("ChunkSize") or 1)),
+            jobInfos["BlockName"],
+            report,
+            self.core.getConfig("Afanasy", "verifyWorkers", dft=8, config="project"),
+        )
+
+    @err_catcher(name=__name__)
+    def getAfanasyFilePattern(self, path):
+        # "name.####.exr" -> "name.@####@.exr", Afanasy fills in the frames of the task
+        return re.sub(r"#+", lambda m: "@%s@" % m.group(0), path.replace("\\", "/"), count=1)
+
+    @err_catcher(name=__name__)
+    def getProxyPath(self, outputPath):
+        folder, filename = os.path.split(outputPath)
+        return os.path.join(folder, "proxy", os.path.splitext(filename)[0] + ".jpg").replace("\\", "/")
+
+    @err_catcher(name=__name__)
+    def getProxyCommand(self, jobInfos, pluginInfos):
+        # one converter call per frame, through the frames wrapper for chunked tasks
+        template = self.core.getConfig(
+            "Afanasy",
+            "proxyCommand",
+            dft='oiiotool "{input}" --ch R,G,B --resize {width}x0 --colorconvert linear sRGB -o "{output}"',
+            config="project",
+        )
+        proxyPath = self.getProxyPath(jobInfos["OutputFilename0"])
+        if not os.path.exists(os.path.dirname(proxyPath)):
+            os.makedirs(os.path.dirname(proxyPath))
+
+        cmd = template.format(
+            input=jobInfos["OutputFilename0"].replace("\\", "/"),
+            output=proxyPath,
+            width=self.core.getConfig("Afanasy", "proxyWidth", dft=960, config="project"),
+        )
+        script = self.stageFarmScript("AfanasyAssUtils.py", os.path.dirname(pluginInfos["Manifest"]))
+        return '%s "%s" frames --start @#@ --end @#@ -- %s' % (self.getFarmPython(), script, cmd)
+
+    @err_catcher(name=__name__)
+    def getCleanupCommand(self, pluginInfos, layerData, generated=True, scene=False):
+        if not generated and not scene:
+            return
+
+        script = self.stageFarmScript("AfanasyCleanup.py", os.path.dirname(pluginInfos["Manifest"]))
+        cmd = '%s "%s" --manifest "%s"' % (
+            self.getFarmPython(),
+            script,
+            pluginInfos["Manifest"].replace("\\", "/"),
+        )
+        if generated:
+            cmd += ' --generated --prefix "%s"' % layerData["filename"]
+
+        if scene:
+            cmd += ' --scene --store "%s"' % self.getSceneStorePath().replace("\\", "/")
+
+        return cmd
+
     @err_catcher(name=__name__)
     def addEnvironmentItem(self, data, key, value):
         idx = 0
@@ -876,70 +2039,593 @@ template = base + "_@product@@identifier@_@version@"]"""
                 return jobId
 
     @err_catcher(name=__name__)
-    def AfanasySubmitJob(self, jobInfos, pluginInfos, arguments):
-    
-        frame_info = inspect.stack()[1]
-        calling_function_name = frame_info.function
+    def getJobNames(self, jobIds):
+        names = {}
+        unknownIds = []
+        for jobId in jobIds:
+            if jobId in self.submittedJobNames:
+                names[jobId] = self.submittedJobNames[jobId]
+            elif jobId.isdigit():
+                unknownIds.append(int(jobId))
+
+        if unknownIds:
+            output = self.CallAfanasyCommand({'type': 'jobs', 'ids': unknownIds}, silent=True) or {}
+            for jobData in output.get('jobs', []):
+                self.submittedJobNames[str(jobData['id'])] = jobData['name']
+                names[str(jobData['id'])] = jobData['name']
+
+        return names
 
-        print("Submit")
-        print(jobInfos)
+    @err_catcher(name=__name__)
+    def getFarmCapacity(self, pool, hostsMask=None, excludeMask=None, tasksPerHost=1):
+        # queried on every submission, the cached farm metadata is too old for the current load
+        output = self.CallAfanasyCommand({'type': 'renders'}, silent=True)
+        if not output:
+            return
 
-        
-        service = 'arnold' #to do
-        
-        self.core.callback(
-            name="preSubmit_Afanasy",
-            args=[self, jobInfos, pluginInfos, arguments],
+        hosts = []
+        for renderData in output.get('renders', []):
+            name = renderData.get('name', "")
+            state = renderData.get('state', "")
+            if "OFF" in state or "NBY" in state.upper():
+                continue
+
+            renderPool = renderData.get('pool') or ""
+            if pool and renderPool and renderPool != pool and not renderPool.startswith(pool.rstrip("/") + "/"):
+                continue
+
+            if hostsMask and not re.match(hostsMask, name):
+                continue
+
+            if excludeMask and re.match(excludeMask, name):
+                continue
+
+            host = renderData.get('host', {})
+            resources = renderData.get('host_resources', {})
+            hosts.append(
+                {
+                    "capacity": renderData.get('capacity', host.get('capacity')) or 0,
+                    "used": renderData.get('capacity_used', 0) or 0,
+                    "cpus": resources.get('cpu_num'),
+                    "memory": resources.get('mem_total_mb'),
+                }
+            )
+
+        if not hosts:
+            return
+
+        capacities = sorted(h["capacity"] for h in hosts)
+        cpus = sorted(h["cpus"] for h in hosts if h["cpus"])
+        memory = sorted(h["memory"] for h in hosts if h["memory"])
+        capacity = {
+            "hosts": len(hosts),
+            "capacity": sum(capacities),
+            "free": sum(max(0, h["capacity"] - h["used"]) for h in hosts),
+            "hostCapacity": capacities[int(len(capacities) / 2)],
+            "minCapacity": capacities[0],
+            "cpus": cpus[int(len(cpus) / 2)] if cpus else None,
+            "memory": memory[int(len(memory) / 2)] if memory else None,
+            "tasksPerHost": tasksPerHost,
+        }
+        logger.debug("farm capacity for pool \"%s\": %s" % (pool, capacity))
+        return capacity
+
+    @err_catcher(name=__name__)
+    def getTypicalHost(self, jobInfos):
+        capacity = jobInfos.get("FarmCapacity")
+        if capacity:
+            return capacity
+
+        # the cached render list is good enough for the hardware of the hosts
+        renders = self.getFarmMetadata("renders")
+        hostsMask = jobInfos.get("HostsMask")
+        excludeMask = jobInfos.get("ExcludeHostsMask")
+        renders = [
+            r for r in renders
+            if not (hostsMask and not re.match(hostsMask, r.get("name") or ""))
+            and not (excludeMask and re.match(excludeMask, r.get("name") or ""))
+        ]
+        host = {}
+        for key in ["capacity", "cpus", "memory"]:
+            values = sorted(r[key] for r in renders if r.get(key))
+            host[key] = values[int(len(values) / 2)] if values else None
+            if key == "capacity":
+                host["minCapacity"] = values[0] if values else None
+
+        host["hostCapacity"] = host.pop("capacity")
+        return host
+
+    @err_catcher(name=__name__)
+    def applyTaskPacking(self, jobInfos, layers):
+        tasksPerHost = jobInfos.get("TasksPerHost") or 1
+        if tasksPerHost <= 1:
+            return
+
+        host = self.getTypicalHost(jobInfos)
+        # the smallest matching host has to fit <tasksPerHost> tasks, larger hosts fit them anyway
+        hostCapacity = host.get("minCapacity") or self.core.getConfig(
+            "Afanasy", "hostCapacity", dft=1000, config="project"
         )
+        packing = {
+            "tasksPerHost": tasksPerHost,
+            "capacity": max(1, int(hostCapacity / tasksPerHost)),
+        }
+        if host.get("memory"):
+            packing["memory"] = int(host["memory"] / tasksPerHost)
+
+        if host.get("cpus"):
+            packing["threads"] = max(1, int(host["cpus"] / tasksPerHost))
+            for layerData in layers:
+                layerData["command"] = layerData["command"].replace(
+                    "kick -i", "kick -t %s -i" % packing["threads"], 1
+                )
+
+        jobInfos["TaskPacking"] = packing
+        logger.debug("task packing: %s" % packing)
 
+    @err_catcher(name=__name__)
+    def getRegistry(self):
+        if not self.registry:
+            path = self.core.getConfig("Afanasy", "registryPath", config="project") or os.path.join(
+                self.core.projects.getPipelineFolder(), "Afanasy", "submissions.db"
+            )
+            self.registry = AfanasyRegistry.SubmissionRegistry(path)
+
+        return self.registry
+
+    @err_catcher(name=__name__)
+    def recordSubmission(self, jobId, stages):
+        # stages: (jobInfos, pluginInfos) of every block group sent in the job
+        try:
+            registry = self.getRegistry()
+            for jobInfos, pluginInfos in stages:
+                registry.addSubmission(jobId, jobInfos, pluginInfos, context=jobInfos.get("Context"))
+        except Exception as e:
+            # the job is on the farm already, a locked registry must not fail the publish
+            logger.warning("failed to record the submission of job %s: %s" % (jobId, e))
+
+        self.recordPendingTimings(jobId, [jobInfos for jobInfos, pluginInfos in stages])
+
+    @err_catcher(name=__name__)
+    def findSubmissions(self, product=None, version=None, jobId=None):
+        if jobId is not None:
+            return self.getRegistry().findByJobId(jobId)
+
+        return self.getRegistry().findByProduct(product, version)
+
+    @err_catcher(name=__name__)
+    def getTimingStore(self):
+        if not self.timingStore:
+            path = self.core.getConfig("Afanasy", "timingStorePath", config="project") or os.path.join(
+                self.core.getUserPrefDir(), "Afanasy", "frameTimings.db"
+            )
+            self.timingStore = AfanasyStats.FrameTimingStore(path)
+
+        return self.timingStore
+
+    @err_catcher(name=__name__)
+    def getTimingKey(self, details, layer):
+        details = details or {}
+        if details.get("type") == "asset" or not details.get("shot"):
+            shot = details.get("asset_path") or details.get("asset") or ""
+        else:
+            shot = "%s-%s" % (details.get("sequence", ""), details.get("shot"))
+
+        identifier = details.get("identifier") or ""
+        return shot, "%s_%s" % (identifier, layer) if identifier else layer, self.renderName or ""
+
+    @err_catcher(name=__name__)
+    def recordPendingTimings(self, jobId, jobInfosList):
+        # the timings get ingested once the job is done
+        store = self.getTimingStore()
+        for jobInfos in jobInfosList:
+            if not jobInfos.get("TimingKey"):
+                continue
+
+            blockName = jobInfos.get("BlockName") or jobInfos["Name"]
+            shot, layer, renderer = jobInfos["TimingKey"]
+            store.addPendingJob(jobId, blockName, shot, layer, renderer, jobInfos.get("ChunkSize") or 1)
+
+    @err_catcher(name=__name__)
+    def ingestFrameTimings(self):
+        # the farm is asked in a background thread, finished jobs improve the predictions of later submissions
+        if not getattr(self, "timingIngest", None):
+            self.timingIngest = AfanasyStats.TimingIngest(
+                self.getTimingStore(), lambda arguments: self.CallAfanasyCommand(arguments, silent=True)
+            )
+
+        self.timingIngest.start()
+
+    @err_catcher(name=__name__)
+    def applyFrameHistory(self, jobInfos, details, layer):
+        stats = self.getTimingStore().getFrameStats(*self.getTimingKey(details, layer))
+        if not stats:
+            logger.debug("no render history for %s, using the frames per task of the state" % layer)
+            return
+
+        maxRunning = self.getMaxRunningTasks(jobInfos) or len(self.getFarmMetadata("renders")) or 1
+
+        prediction = AfanasyStats.predictJob(
+            stats,
+            len(self.getFrameList(jobInfos["Frames"])),
+            maxRunning,
+            targetTaskMinutes=self.core.getConfig("Afanasy", "targetTaskMinutes", dft=10, config="project"),
+        )
+        jobInfos["ChunkSize"] = prediction["framesPerTask"]
+        jobInfos["TaskTimeoutMinutes"] = prediction["timeoutMinutes"]
+        jobInfos["PredictedEta"] = prediction["etaSeconds"]
+        logger.debug("render history of %s (%s tasks): %s" % (layer, stats["samples"], prediction))
+
+    @err_catcher(name=__name__)
+    def getMemoryNeed(self, layerData):
+        # in MB, estimated from the exported .ass files, Afanasy doesn't report the memory of finished tasks
+        # nothing exported yet when the export runs on the farm
+        files = AfanasyAssUtils.getExportedAssFiles(layerData["filename"], layerData["compression"])
+        return AfanasyAssUtils.estimateRenderMemory(
+            files,
+            layerData["compression"],
+            factor=self.core.getConfig("Afanasy", "assMemoryFactor", dft=3.0, config="project"),
+            baseMemory=self.core.getConfig("Afanasy", "renderBaseMemory", dft=1024, config="project"),
+        )
+
+    @err_catcher(name=__name__)
+    def addChunkingToCommands(self, pluginInfos, layers):
+        # a task renders several frames, one kick call per frame
+        script = self.stageFarmScript("AfanasyAssUtils.py", os.path.dirname(pluginInfos["Manifest"]))
+        wrapper = '%s "%s" frames --start @#@ --end @#@ --' % (self.getFarmPython(), script)
+        for layerData in layers:
+            layerData["command"] = wrapper + " " + re.sub(r"@(#+)@", r"\1", layerData["command"])
+
+    @err_catcher(name=__name__)
+    def splitDependencies(self, jobInfos):
+        # "block:<name>" ids reference blocks of the combined pipeline job
+        jobIds = []
+        blockNames = []
+        for jobId in jobInfos.get("JobDependencies", "").split(","):
+            jobId = jobId.strip()
+            if not jobId:
+                continue
+
+            if jobId.startswith("block:"):
+                blockNames.append(jobId[len("block:"):])
+            else:
+                jobIds.append(jobId)
+
+        return jobIds, blockNames
+
+    @err_catcher(name=__name__)
+    def getNameMask(self, names):
+        return "^(%s)$" % "|".join(sorted(set(re.escape(name) for name in names)))
+
+    @err_catcher(name=__name__)
+    def applyJobDependencies(self, job, jobInfos):
+        # the server releases the job as soon as all matching jobs are done, no polling needed
+        jobIds, blockNames = self.splitDependencies(jobInfos)
+
+        masks = []
+        if jobInfos.get("DependMask"):
+            masks.append(jobInfos["DependMask"])
+
+        names = self.getJobNames(jobIds)
+        if names:
+            masks.append(self.getNameMask(names.values()))
+
+        missing = [jobId for jobId in jobIds if jobId not in names]
+        if missing:
+            logger.warning("unable to find the Afanasy jobs %s to depend on" % ", ".join(missing))
+
+        if masks:
+            job.setDependMask("|".join(masks))
+
+        if jobInfos.get("GlobalDependMask"):
+            job.setDependMaskGlobal(jobInfos["GlobalDependMask"])
+
+    @err_catcher(name=__name__)
+    def isCombiningStates(self):
+        return self.core.getConfig("Afanasy", "combineStates", dft=False, config="project")
+
+    @err_catcher(name=__name__)
+    def getMaxRunningTasks(self, jobInfos):
+        machineLimit = int(jobInfos.get("MachineLimit") or 0)
+        capacity = jobInfos.get("FarmCapacity")
+        if capacity:
+            # sized from the pool, so the job takes over hosts as the farm empties
+            maxTasks = capacity["hosts"] * capacity["tasksPerHost"]
+            if machineLimit > 0:
+                maxTasks = min(maxTasks, machineLimit)
+
+            return max(1, maxTasks)
+
+        return machineLimit
+
+    @err_catcher(name=__name__)
+    def applyHostLimits(self, item, jobInfos):
+        # works on jobs and blocks, both have the same setters
+        maxTasks = self.getMaxRunningTasks(jobInfos)
+        if maxTasks > 0:
+            item.setMaxRunningTasks(maxTasks)
+
+        if jobInfos.get("HostsMask"):
+            item.setHostsMask(jobInfos["HostsMask"])
+
+        if jobInfos.get("ExcludeHostsMask"):
+            item.setHostsMaskExclude(jobInfos["ExcludeHostsMask"])
+
+    @err_catcher(name=__name__)
+    def getJobLevelSettings(self, jobInfos):
+        # settings Afanasy only has per job, states with different values can't share a job
+        return dict((key, jobInfos.get(key)) for key in ["Priority", "Pool", "InitialStatus", "DependMask", "GlobalDependMask"])
+
+    @err_catcher(name=__name__)
+    def createJob(self, jobInfos, pluginInfos):
         # Create a job
-        self.job = self.af.Job(jobInfos['Name'])
+        job = self.af.Job(jobInfos['Name'])
 
 
-        # Set job depend mask
-        self.job.setDependMask(jobInfos['Name'])
+        # Set job depend masks
+        self.applyJobDependencies(job, jobInfos)
 
 
-        # Set maximum tasks that can be executed simultaneously
-        self.job.setMaxRunningTasks(15)
+        # Set maximum tasks and hosts masks, combined jobs set them per block
+        self.applyHostLimits(job, jobInfos)
 
-        # Set job hosts mask
-        self.job.setHostsMask('render.*')
-        
+        # pools are supported by newer Afanasy versions only
+        if jobInfos.get("Pool") and hasattr(job, "setPool"):
+            job.setPool(jobInfos["Pool"])
 
-        self.job.setPriority(jobInfos['Priority'])
+
+        job.setPriority(jobInfos['Priority'])
+
+        if jobInfos.get("PredictedEta"):
+            job.setAnnotation("ETA ~%s min" % int(math.ceil(jobInfos["PredictedEta"] / 60.0)))
 
         # Start job paused
         #if jobInfos['InitialStatus']=='Suspended':
         if 'InitialStatus' in jobInfos:
-            self.job.offLine()
+            job.offLine()
 
-        # Create a block with provided name and service type
-        block = self.af.Block('back', service)
+        if pluginInfos.get("SceneFile"):
+            job.setFolder("scene", os.path.dirname(pluginInfos["SceneFile"]))
 
-        # Set block tasks command
-        block.setCommand(jobInfos["PathS"])
+        if pluginInfos.get("Manifest"):
+            job.setFolder("manifest", os.path.dirname(pluginInfos["Manifest"]))
 
-        # Set block tasks preview command arguments
-        block.setFiles(['jpg/img.@####@.jpg'])
+        # Set command to execute by server after a job is deleted.
+        #job.setCmdPost('rm /projects/test/nuke/scene.nk.tmp.nk')
+        return job
 
-        # Set block to numeric type, providing first, last frame and frames per host
-        rangeGet = jobInfos['Frames'].split("-")
-        block.setNumeric(int(rangeGet[0]), int(rangeGet[1]), 1)
+    @err_catcher(name=__name__)
+    def createJobBlocks(self, jobInfos, pluginInfos):
+        service = 'arnold' #to do
+        blocks = []
+        blockName = jobInfos.get("BlockName") or jobInfos['Name']
+
+        # Create a block with provided name and service type
+        block = self.af.Block(blockName, service)
+        frameRanges = self.getFrameRanges(jobInfos['Frames'])
+
+        dependNames = []
+        subTask = True
+        jobIds, blockNames = self.splitDependencies(jobInfos)
+        if blockNames:
+            dependNames += blockNames
+            # tasks are released per frame only without a frame offset, otherwise they wait for the whole block
+            offset = int(jobInfos.get("FrameDependencyOffsetStart") or 0)
+            subTask = jobInfos.get("IsFrameDependent") == "true" and offset == 0
+
+        # sub task dependencies match the frames of numeric blocks only
+        subTask = subTask and len(frameRanges) == 1
+
+        if jobInfos.get("ExportCommand"):
+            # the scene gets exported on the farm in chunks, each render task waits for the chunk with its frames only
+            exportBlock = self.af.Block(blockName + "_export", "maya")
+            framesPerTask = self.core.getConfig("Afanasy", "exportFramesPerTask", dft=10, config="project")
+            self.setBlockFrames(exportBlock, jobInfos["ExportCommand"], frameRanges, framesPerTask)
+            # the render tasks wait for their frames, so the export runs in the same order
+            self.setBlockOrder(exportBlock, jobInfos)
+            blocks.append(exportBlock)
+            dependNames.append(blockName + "_export")
+
+        if dependNames:
+            block.setDependMask(self.getNameMask(dependNames))
+            if subTask:
+                block.setDependSubTask()
+
+        packing = jobInfos.get("TaskPacking")
+        if packing:
+            block.setCapacity(packing["capacity"])
+            block.setMaxRunTasksPerHost(packing["tasksPerHost"])
+
+        # hosts only take the task when this much memory is free, otherwise fall back to the host share
+        if jobInfos.get("NeedMemory"):
+            block.setNeedMemory(jobInfos["NeedMemory"])
+        elif packing and packing.get("memory"):
+            block.setNeedMemory(packing["memory"])
+
+        # Set block tasks preview files
+        if jobInfos.get("OutputFilename0"):
+            block.setFiles([self.getAfanasyFilePattern(jobInfos["OutputFilename0"])])
+
+        # Set block tasks command, numeric with first, last frame and frames per task for a single range
+        self.setBlockFrames(block, jobInfos["PathS"], frameRanges, max(1, int(jobInfos.get("ChunkSize") or 1)))
+        self.setBlockOrder(block, jobInfos)
+
+        timeout = int(jobInfos.get("TaskTimeoutMinutes") or 0)
+        if timeout > 0:
+            block.setTasksMaxRunTime(timeout * 60)
 
         # Add block to the job
-        self.job.blocks.append(block)
+        blocks.append(block)
+
+        if jobInfos.get("ProxyCommand"):
+            # small tasks with a low capacity, they fill the gaps between the render tasks
+            proxyBlock = self.af.Block(blockName + "_proxy", "generic")
+            proxyBlock.setDependMask(self.getNameMask([blockName]))
+            if len(frameRanges) == 1:
+                proxyBlock.setDependSubTask()
+
+            proxyBlock.setCapacity(self.core.getConfig("Afanasy", "proxyCapacity", dft=50, config="project"))
+            self.setBlockFrames(
+                proxyBlock, jobInfos["ProxyCommand"], frameRanges, max(1, int(jobInfos.get("ChunkSize") or 1))
+            )
+            self.setBlockOrder(proxyBlock, jobInfos)
+            proxyBlock.setFiles([self.getAfanasyFilePattern(self.getProxyPath(jobInfos["OutputFilename0"]))])
+            blocks.append(proxyBlock)
+
+        cleanupDepends = [blockName]
+        if jobInfos.get("VerifyCommand"):
+            # checks the frames of each render task as soon as it is done
+            verifyBlock = self.af.Block(blockName + "_verify", "generic")
+            verifyBlock.setDependMask(self.getNameMask([blockName]))
+            if len(frameRanges) == 1:
+                verifyBlock.setDependSubTask()
+
+            verifyBlock.setCapacity(self.core.getConfig("Afanasy", "verifyCapacity", dft=100, config="project"))
+            self.setBlockFrames(
+                verifyBlock, jobInfos["VerifyCommand"], frameRanges, max(1, int(jobInfos.get("ChunkSize") or 1))
+            )
+            self.setBlockOrder(verifyBlock, jobInfos)
+            blocks.append(verifyBlock)
+            # restarted render tasks still need the generated files
+            cleanupDepends.append(blockName + "_verify")
+
+        if jobInfos.get("CleanupCommand"):
+            # runs once after all render tasks and takes only a small share of a host
+            cleanupBlock = self.af.Block(blockName + "_cleanup", "generic")
+            cleanupBlock.setDependMask(self.getNameMask(cleanupDepends))
+            cleanupBlock.setCapacity(100)
+            cleanupTask = self.af.Task("cleanup")
+            cleanupTask.setCommand(jobInfos["CleanupCommand"])
+            cleanupBlock.tasks.append(cleanupTask)
+            blocks.append(cleanupBlock)
+
+        return blocks
 
-        # Set command to execute by server after a job is deleted.
-        #self.job.setCmdPost('rm /projects/test/nuke/scene.nk.tmp.nk')
+    @err_catcher(name=__name__)
+    def sendJob(self, job, jobName):
         # Send job to Afanasy server
+        submitTime = time.time()
+        try:
+            timeout = self.core.getConfig("Afanasy", "farmSubmitTimeout", dft=60, config="project")
+            result = self.getFarmBreaker().call(
+                job.send, timeout=timeout, isSuccess=lambda result: bool(result) and result[0] is not False
+            )
+        except AfanasyNetwork.FarmTimeout as e:
+            # the abandoned send can still arrive, reporting a failure would make the artist submit it twice
+            jobId = self.findSubmittedJob(jobName, submitTime)
+            if jobId is not None:
+                logger.warning("no answer after submitting \"%s\", but the job arrived as %s" % (jobName, jobId))
+                result = [True, {"id": jobId}]
+            else:
+                self.core.popup(
+                    "No answer from Afanasy after submitting job \"%s\": %s\n\n"
+                    "Please check the job list before submitting again, the job may still arrive." % (jobName, e)
+                )
+                result = [False]
+        except Exception as e:
+            self.core.popup("Failed to submit job \"%s\" to Afanasy: %s" % (jobName, e))
+            result = [False]
 
-        result = self.job.send()
-        if result[0]:
+        if result and result[0]:
             jobResult="Result=Success"
+            answer = result[1] if len(result) > 1 else None
+            if isinstance(answer, dict) and answer.get("id") is not None:
+                self.submittedJobNames[str(answer["id"])] = jobName
+                self.getJobTracker().track(answer["id"], jobName)
+                jobResult += "\nJobID=%s" % answer["id"]
         else:
             jobResult="Result=Err"
 
+        return jobResult
+
+    @err_catcher(name=__name__)
+    def findSubmittedJob(self, jobName, since, attempts=3, interval=2):
+        # a job with this name created by this submission, looked up after the send timed out
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(interval)
+
+            output = self.CallAfanasyCommand({'type': 'jobs', 'mask': re.escape(jobName)}, silent=True)
+            jobs = output.get("jobs") if isinstance(output, dict) else None
+            for jobData in jobs or []:
+                # allow for clock differences between this machine and the server
+                if jobData.get("name") == jobName and jobData.get("time_creation", 0) >= since - 60:
+                    return jobData.get("id")
+
+    @err_catcher(name=__name__)
+    def submitPipelineJob(self):
+        # all states of the publish in one job, their blocks depend on each other per task
+        if not self.pipelineStages:
+            return
+
+        stages = self.pipelineStages
+        self.pipelineStages = []
+        jobInfos, pluginInfos, blocks = stages[0]
+        jobInfos = jobInfos.copy()
+        jobIds = []
+        for stageJobInfos, stagePluginInfos, stageBlocks in stages:
+            jobIds += self.splitDependencies(stageJobInfos)[0]
+
+        jobInfos["JobDependencies"] = ",".join(jobIds)
+        # the limits and masks of every state are on its own blocks
+        for key in ["MachineLimit", "FarmCapacity", "HostsMask", "ExcludeHostsMask"]:
+            jobInfos.pop(key, None)
+
+        job = self.createJob(jobInfos, pluginInfos)
+        for stageJobInfos, stagePluginInfos, stageBlocks in stages:
+            job.blocks += stageBlocks
+
+        result = self.sendJob(job, jobInfos['Name'])
+        jobId = self.getJobIdFromSubmitResult(result)
+        if jobId:
+            self.recordSubmission(jobId, [(stage[0], stage[1]) for stage in stages])
+
+        logger.debug("submitted pipeline job with %s stages: %s" % (len(stages), result))
+        return result
+
+    @err_catcher(name=__name__)
+    def AfanasySubmitJob(self, jobInfos, pluginInfos, arguments):
+    
+        frame_info = inspect.stack()[1]
+        calling_function_name = frame_info.function
+
+        print("Submit")
+        print(jobInfos)
+
+        self.core.callback(
+            name="preSubmit_Afanasy",
+            args=[self, jobInfos, pluginInfos, arguments],
+        )
+
+        blocks = self.createJobBlocks(jobInfos, pluginInfos)
+        if self.isCombiningStates():
+            # sent as one job in postPublish
+            if self.pipelineStages:
+                first = self.getJobLevelSettings(self.pipelineStages[0][0])
+                settings = self.getJobLevelSettings(jobInfos)
+                different = sorted(key for key in settings if settings[key] != first[key])
+                if different:
+                    msg = (
+                        "Unable to combine \"%s\" with the other states of this publish into one Afanasy job.\n"
+                        "These settings have to be the same in all states: %s"
+                        % (jobInfos["Name"], ", ".join(different))
+                    )
+                    self.core.popup(msg)
+                    return "Result=Err\n" + msg
+
+            for block in blocks:
+                self.applyHostLimits(block, jobInfos)
+
+            self.pipelineStages.append((jobInfos.copy(), pluginInfos.copy(), blocks))
+            blockName = jobInfos.get("BlockName") or jobInfos['Name']
+            return "Result=Success\nJobID=block:%s" % blockName
+
+        self.job = self.createJob(jobInfos, pluginInfos)
+        self.job.blocks += blocks
+        jobResult = self.sendJob(self.job, jobInfos['Name'])
+        jobId = self.getJobIdFromSubmitResult(jobResult)
+        if jobId:
+            self.recordSubmission(jobId, [(jobInfos, pluginInfos)])
 
         logger.debug("submitting job: " + str(arguments))
         return jobResult
@@ -1080,10 +2766,10 @@ class PresetItem(QWidget):
         self.e_name.setPlaceholderText("Name")
         self.cb_pool = QComboBox()
         self.cb_pool.setToolTip("Pool")
-        self.cb_pool.addItems(["< Pool >"] + self.plugin.getAfanasyPools())
+        self.cb_pool.setModel(self.plugin.getFarmModel("pools", "< Pool >"))
         self.cb_group = QComboBox()
         self.cb_group.setToolTip("Group")
-        self.cb_group.addItems(["< Group >"] + self.plugin.getAfanasyGroups())
+        self.cb_group.setModel(self.plugin.getFarmModel("groups", "< Group >"))
 
         self.b_remove = QToolButton()
         self.b_remove.clicked.connect(lambda: self.removed.emit(self))